@@ -0,0 +1,65 @@
+"""seen_ad table replaces previous_ads
+
+Revision ID: 5e0c2a7d91f4
+Revises: 3584d71814ce
+Create Date: 2026-10-18 11:02:14.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import String
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0c2a7d91f4'
+down_revision: Union[str, None] = '3584d71814ce'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('seen_ad',
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('ad_id', sa.BigInteger(), nullable=False),
+    sa.Column('first_seen', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'ad_id')
+    )
+    op.create_index(op.f('ix_seen_ad_first_seen'), 'seen_ad', ['first_seen'], unique=False)
+
+    # Backfill from the JSON blobs, entries are listing IDs or older caption
+    # strings holding the ad URL the ID is read from
+    op.execute("""
+        INSERT INTO seen_ad (user_id, ad_id, first_seen)
+        SELECT DISTINCT u.id, entries.ad_id, now()
+        FROM "user" u
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(
+                substring(e.value FROM '^(\\d+)$'),
+                substring(e.value FROM '/auto-oglasi/(\\d+)')
+            )::bigint AS ad_id
+            FROM json_array_elements_text(u.previous_ads::json) AS e(value)
+        ) entries
+        WHERE entries.ad_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+    op.drop_column('user', 'previous_ads')
+
+
+def downgrade() -> None:
+    op.add_column('user', sa.Column('previous_ads', String(), nullable=True))
+    op.execute("""
+        UPDATE "user" u
+        SET previous_ads = COALESCE(
+            (SELECT json_agg(s.ad_id)::text FROM seen_ad s WHERE s.user_id = u.id),
+            '[]'
+        )
+    """)
+    op.alter_column('user', 'previous_ads',
+               existing_type=sa.VARCHAR(),
+               nullable=False)
+    op.drop_index(op.f('ix_seen_ad_first_seen'), table_name='seen_ad')
+    op.drop_table('seen_ad')
@@ -8,12 +8,11 @@ from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
 from pydantic import ValidationError
 
 from sqlmodel import Session
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core import security
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import AsyncSessionLocal
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -22,10 +21,7 @@ reusable_oauth2 = OAuth2PasswordBearer(
 
 
 async def get_db() -> AsyncGenerator[AsyncSession]:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession
-    )
-    async with async_session() as session:
+    async with AsyncSessionLocal() as session:
         yield session
 
 
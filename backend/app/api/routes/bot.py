@@ -1,28 +1,54 @@
 import json
+import zlib
 from typing import Any
+from datetime import datetime, timedelta, timezone
 
-from telegram import Update, Bot
+import httpx
+import msgpack
+from pydantic import ValidationError
+from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import APIRouter, Request, BackgroundTasks, Response, status, HTTPException
 
 from sqlmodel import select
 
-from app import crud
+from app import crud, outbox
 from app.api.deps import SessionDep
 from app.core.config import settings
 from app.core.db import AsyncSessionLocal
 from app.core.security import verify_password
-from app.models import User, UserUpdate, UserCreate, UsersPublic, TaskRequest, AdsRequest
+from app.notifications import notifier, build_messages
+from app.models import User, UserUpdate, UserCreate, UsersPublic, TaskRequest, AdsRequest, AdsBatchRequest
 
 
 router = APIRouter()
 
 BOT_TOKEN = settings.BOT_TOKEN
 
-# Initialize Telegram bot
-bot_app = Application.builder().token(BOT_TOKEN).build()
+
+def telegram_request() -> HTTPXRequest:
+    """HTTP client for Bot API calls, pool and timeouts from settings."""
+    return HTTPXRequest(
+        connection_pool_size=settings.TELEGRAM_POOL_SIZE,
+        connect_timeout=settings.TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=settings.TELEGRAM_READ_TIMEOUT,
+        write_timeout=settings.TELEGRAM_WRITE_TIMEOUT,
+        pool_timeout=settings.TELEGRAM_POOL_TIMEOUT,
+        httpx_kwargs={
+            "limits": httpx.Limits(
+                max_connections=settings.TELEGRAM_POOL_SIZE,
+                max_keepalive_connections=settings.TELEGRAM_POOL_SIZE,
+                keepalive_expiry=settings.TELEGRAM_KEEPALIVE_EXPIRY,
+            )
+        },
+    )
+
+
+# Initialize Telegram bot, its bot_app.bot is shared by every route
+bot_app = Application.builder().token(BOT_TOKEN).request(telegram_request()).build()
 
 """User bot commands"""
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -86,15 +112,14 @@ async def link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     email = context.args[0]
     chat_id = update.message.chat_id
 
-    # Check if this chat is already linked to an account
     async with AsyncSessionLocal() as session:
+        # Check if this chat is already linked to an account
         db_user = await crud.get_user_by_chat_id(session=session, chat_id=chat_id)
         # User found with the current chat ID, then that user's account has been linked to the chat already
         if db_user:
             await update.message.reply_text("This chat is already to an account, unlink it with /unlink.")
             return
 
-    async with AsyncSessionLocal() as session:
         db_user = await crud.get_user_by_email(session=session, email=email)
         # Abort if user not found
         if not db_user:
@@ -394,8 +419,7 @@ async def webhook(
 async def set_webhook() -> Response:
     WEBHOOK_URL = "https://auto-nabavka.onrender.com/api/webhook"
 
-    bot = Bot(BOT_TOKEN)
-    bot_set = await bot.set_webhook(WEBHOOK_URL)
+    bot_set = await bot_app.bot.set_webhook(WEBHOOK_URL)
     return bot_set
 
 
@@ -421,6 +445,34 @@ async def queue_tasks(
     return UsersPublic(data=users, count=count)
 
 
+async def dispatch_feed() -> Any:
+    # Own session, the request's is closed before a streamed body is sent
+    async with AsyncSessionLocal() as session:
+        after = None
+        while True:
+            rows = await crud.get_dispatch_page(session=session, after=after, limit=settings.QUEUE_PAGE_SIZE)
+            if not rows:
+                break
+            yield "".join(
+                json.dumps({"id": str(user_id), "chat_id": chat_id, "mobili_url": mobili_url}) + "\n"
+                for user_id, chat_id, mobili_url in rows
+            )
+            after = rows[-1][0]
+
+
+@router.post("/queue-tasks/stream")
+async def queue_tasks_stream(request: TaskRequest) -> Any:
+    # Verify if request is from one of our workers
+    if request.celery_auth != settings.CELERY_AUTH:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid request."
+        )
+
+    # One NDJSON line per user with an active search
+    return StreamingResponse(dispatch_feed(), media_type="application/x-ndjson")
+
+
 @router.post("/send-ads", response_model=int, status_code=200)
 async def send_ads(
     request: AdsRequest,
@@ -430,44 +482,177 @@ async def send_ads(
     if request.celery_auth != settings.CELERY_AUTH:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            ddetail="Invalid request."
+            detail="Invalid request."
         )
     
-    # Bot instance
-    bot = Bot(BOT_TOKEN)
+    # Shared bot instance, initialized in the app lifespan
+    bot = bot_app.bot
 
     # Data from request
     ads = request.ads
     chat_id = request.chat_id
 
-    # Get previous ads from requesting user
+    # Get requesting user
     db_user = await crud.get_user_by_chat_id(session=session, chat_id=chat_id)
-    previous_ads: list[str] = json.loads(db_user.previous_ads)
-    ads_json = json.dumps(ads)
-    user_in = UserUpdate(previous_ads=ads_json)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Record the current ads, getting back the ones not seen before
+    first_time = not await crud.has_seen_ads(session=session, user_id=db_user.id)
+    prune_before = datetime.now(timezone.utc) - timedelta(days=settings.SEEN_ADS_RETENTION_DAYS)
+    new_ids = await crud.record_seen_ads(
+        session=session,
+        user_id=db_user.id,
+        ad_ids=request.ad_ids or [ad.id for ad in ads],
+        prune_before=prune_before
+    )
 
     # Store ads if none found and return
-    if not previous_ads:
-        await crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    if first_time:
+        await session.commit()
         return JSONResponse(
             content={"message": f"FIRST TIME SET: {chat_id}"},
             status_code=status.HTTP_200_OK
         )
 
-    # Send only new ads and rewrite previous ads
-    new_ads = [ad for ad in ads if ad not in previous_ads]
+    # Send only new ads
+    new_ads = [ad for ad in ads if ad.id in new_ids]
+    if any(new_ads) and settings.NOTIFY_QUEUE:
+        # Queued before the seen rows commit, a failed enqueue leaves the ads new for the next post
+        await outbox.enqueue(chat_id, build_messages(new_ads))
+        await session.commit()
+        return JSONResponse(
+            content={"message": f"QUEUED: {len(new_ads)} ad(s) for: {chat_id}"},
+            status_code=status.HTTP_200_OK
+        )
+    await session.commit()
     if any(new_ads):
-        for ad in new_ads:
-            try:
-                await bot.send_message(chat_id=chat_id, text=ad)
-            except Exception:
-                continue
-        await crud.update_user(session=session, db_user=db_user, user_in=user_in)
+        report = await notifier.send(bot, [(chat_id, message) for message in build_messages(new_ads)])
         return JSONResponse(
-            content={"message": f"NEW: {len(new_ads)} ad(s) for: {chat_id}"},
+            content={"message": f"NEW: {len(new_ads)} ad(s) for: {chat_id}, {report}"},
             status_code=status.HTTP_200_OK
         )
     return JSONResponse(
         content={"message": "No new ads"},
         status_code=status.HTTP_200_OK
     )
+
+
+async def read_body(request: Request) -> bytes:
+    """The request body, refused once it or its decompressed form grows past the limits."""
+
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="Request body too large."
+    )
+    if int(request.headers.get("content-length") or 0) > settings.SEND_BATCH_MAX_BYTES:
+        raise too_large
+
+    gzipped = request.headers.get("content-encoding") == "gzip"
+    # wbits 31 reads the gzip header and trailer
+    decompressor = zlib.decompressobj(31) if gzipped else None
+    received, chunks, size = 0, [], 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > settings.SEND_BATCH_MAX_BYTES:
+            raise too_large
+        if decompressor:
+            # Never inflate more than one byte past the limit
+            chunk = decompressor.decompress(chunk, settings.SEND_BATCH_MAX_DECOMPRESSED - size + 1)
+            if decompressor.unconsumed_tail:
+                raise too_large
+        size += len(chunk)
+        if size > settings.SEND_BATCH_MAX_DECOMPRESSED:
+            raise too_large
+        chunks.append(chunk)
+    if decompressor and not decompressor.eof:
+        raise ValueError("Truncated gzip body")
+    return b"".join(chunks)
+
+
+async def decode_body(request: Request) -> Any:
+    # Workers may gzip the body and send msgpack instead of JSON
+    body = await read_body(request)
+    if request.headers.get("content-type", "").startswith(("application/msgpack", "application/x-msgpack")):
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+
+@router.post("/send-ads-batch", status_code=200)
+async def send_ads_batch(
+    request: Request,
+    session: SessionDep
+) -> Any:
+    try:
+        batch = AdsBatchRequest.model_validate(await decode_body(request))
+    except (ValueError, zlib.error, msgpack.UnpackException) as e:
+        detail = e.errors() if isinstance(e, ValidationError) else "Malformed request body."
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail)
+
+    # Verify if request is from one of our workers
+    if batch.celery_auth != settings.CELERY_AUTH:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid request."
+        )
+
+    # Ads per chat, merging repeated chats
+    ads_by_chat: dict[int, dict[int, Any]] = {}
+    # Every current ad ID per chat, including ones the worker didn't resend
+    ids_by_chat: dict[int, set[int]] = {}
+    for result in batch.results:
+        chat_ads = ads_by_chat.setdefault(result.chat_id, {})
+        for ad in result.ads:
+            chat_ads.setdefault(ad.id, ad)
+        ids_by_chat.setdefault(result.chat_id, set()).update(result.ad_ids or chat_ads)
+
+    # Every requesting user in one query
+    db_users = await crud.get_users_by_chat_ids(session=session, chat_ids=list(ads_by_chat))
+    users = {db_user.chat_id: db_user for db_user in db_users}
+    results: dict[int, str] = {
+        chat_id: "User not found" for chat_id in ads_by_chat if chat_id not in users
+    }
+
+    # Record every user's current ads in one transaction
+    seen_users = await crud.users_with_seen_ads(session=session, user_ids=[user.id for user in users.values()])
+    prune_before = datetime.now(timezone.utc) - timedelta(days=settings.SEEN_ADS_RETENTION_DAYS)
+    new_ids = await crud.record_seen_ads_batch(
+        session=session,
+        ad_ids={user.id: list(ids_by_chat[chat_id]) for chat_id, user in users.items()},
+        prune_before=prune_before
+    )
+
+    outgoing: dict[int, list] = {}
+    for chat_id, db_user in users.items():
+        if db_user.id not in seen_users:
+            results[chat_id] = "FIRST TIME SET"
+            continue
+        new_ads = [ad for ad_id, ad in ads_by_chat[chat_id].items() if ad_id in new_ids[db_user.id]]
+        if not new_ads:
+            results[chat_id] = "No new ads"
+            continue
+        results[chat_id] = f"NEW: {len(new_ads)} ad(s)"
+        outgoing[chat_id] = build_messages(new_ads)
+
+    if outgoing and settings.NOTIFY_QUEUE:
+        # Queued before the seen rows commit, see send_ads
+        for chat_id, messages in outgoing.items():
+            await outbox.enqueue(chat_id, messages)
+        await session.commit()
+        summary = f"QUEUED: {sum(map(len, outgoing.values()))} message(s)"
+    elif outgoing:
+        await session.commit()
+        # Chats are sent to concurrently, shared flood limits apply
+        report = await notifier.send(
+            bot_app.bot,
+            [(chat_id, message) for chat_id, messages in outgoing.items() for message in messages]
+        )
+        summary = f"SENT: {report}"
+    else:
+        await session.commit()
+        summary = "No new ads"
+
+    return JSONResponse(
+        content={"message": f"{len(ads_by_chat)} chat(s), {summary}", "results": results},
+        status_code=status.HTTP_200_OK
+    )
@@ -7,6 +7,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from telegram import Bot
 
 from app import crud
+from app.user_cache import user_cache
+from app.core.db import pool_stats
 from app.core.config import settings
 from app.api.deps import (
     CurrentUser,
@@ -80,10 +82,12 @@ async def update_user_me(
                 status_code=409, detail="User with this email already exists"
             )
     user_data = user_in.model_dump(exclude_unset=True)
+    stale_keys = user_cache.keys_for(current_user)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     await session.commit()
     await session.refresh(current_user)
+    await user_cache.invalidate(stale_keys + user_cache.keys_for(current_user))
     return current_user
 
 
@@ -95,6 +99,22 @@ async def read_user_me(current_user: CurrentUser) -> Any:
     return current_user
 
 
+@router.get("/cache-stats", dependencies=[Depends(get_current_active_superuser)])
+async def read_cache_stats() -> Any:
+    """
+    User lookup cache size and hit rate for this API process.
+    """
+    return user_cache.stats()
+
+
+@router.get("/pool-stats", dependencies=[Depends(get_current_active_superuser)])
+async def read_pool_stats() -> Any:
+    """
+    Database connection pool usage and checkout wait times for this API process.
+    """
+    return pool_stats()
+
+
 @router.delete("/me", response_model=Message)
 async def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
     """
@@ -107,6 +127,7 @@ async def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
     await session.execute(statement)  # type: ignore
     await session.delete(current_user)
     await session.commit()
+    await user_cache.invalidate(user_cache.keys_for(current_user))
     return Message(message="User deleted successfully")
 
 
@@ -194,6 +215,7 @@ async def delete_user(
         )
     await session.delete(user)
     await session.commit()
+    await user_cache.invalidate(user_cache.keys_for(user))
     return Message(message="User deleted successfully")
 
 
@@ -61,6 +61,16 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB")
 
+    # Connection pool, connections beyond the pool size are closed when returned
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    # Seconds to wait for a free connection, and before a connection is replaced
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 30 * 60
+    DB_POOL_PRE_PING: bool = False
+    # Prepared statements cached per connection, 0 behind a transaction-mode pgbouncer
+    DB_STATEMENT_CACHE_SIZE: int = 500
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> PostgresDsn:
@@ -77,6 +87,125 @@ class Settings(BaseSettings):
     SUPERUSER_PASSWORD: str = os.getenv("SUPERUSER_PASSWORD")
 
     CELERY_AUTH: str = os.getenv("CELERY_AUTH")
+    # Users per keyset page of the streamed /queue-tasks/stream feed
+    QUEUE_PAGE_SIZE: int = 500
+
+    # Telegram flood limits, messages/sec across all chats and seconds between messages to one chat
+    TELEGRAM_GLOBAL_RATE: float = 30.0
+    TELEGRAM_CHAT_INTERVAL: float = 1.0
+    # Bot API connection pool, shared by every route
+    TELEGRAM_POOL_SIZE: int = 32
+    TELEGRAM_KEEPALIVE_EXPIRY: float = 60.0
+    TELEGRAM_CONNECT_TIMEOUT: float = 5.0
+    TELEGRAM_READ_TIMEOUT: float = 10.0
+    TELEGRAM_WRITE_TIMEOUT: float = 10.0
+    TELEGRAM_POOL_TIMEOUT: float = 5.0
+    # How new ads are packed per chat: "single" message each, text "digest" or photo "media" groups
+    TELEGRAM_BATCH_MODE: Literal["single", "digest", "media"] = "single"
+    # Ads per digest message or media group (media groups hold at most 10)
+    TELEGRAM_BATCH_SIZE: int = 10
+    # Flood-control or network retries before a message is given up on
+    TELEGRAM_MAX_RETRIES: int = 5
+
+    # Queue notifications on a Redis Stream instead of sending them inside /send-ads
+    NOTIFY_QUEUE: bool = False
+    # Run a stream consumer inside the API, off when consumers run separately (python -m app.outbox)
+    NOTIFY_CONSUMER_IN_API: bool = True
+    # Entries read per consumer round, delivered concurrently
+    NOTIFY_BATCH: int = 50
+    # Delivery attempts, one per stream read, before a notification goes to the dead-letter stream
+    NOTIFY_MAX_ATTEMPTS: int = 5
+    # Milliseconds before another consumer claims an entry left pending
+    NOTIFY_CLAIM_IDLE_MS: int = 60000
+    NOTIFY_STREAM_MAXLEN: int = 100000
+
+    # Users cached by chat_id and email per API process (0 disables) and seconds they stay cached
+    USER_CACHE_SIZE: int = 1000
+    USER_CACHE_TTL: float = 300.0
+    # Share invalidations between API replicas over Redis pub/sub
+    USER_CACHE_PUBSUB: bool = False
+
+    # Days a seen ad is remembered after it drops out of a user's results
+    SEEN_ADS_RETENTION_DAYS: int = 30
+
+    # Scraper config
+    # Fetch result pages concurrently with curl_cffi's AsyncSession
+    SCRAPE_ASYNC: bool = False
+    # Max result pages in flight per user search
+    SCRAPE_CONCURRENCY: int = 4
+    # Results page parser, "fast" scans raw bytes and falls back to "bs4" when it finds nothing
+    SCRAPE_PARSER: Literal["fast", "bs4"] = "fast"
+    # Stop paginating once a page holds only ads seen in the last cycle
+    SCRAPE_INCREMENTAL: bool = False
+    # Every Nth cycle of a search reads all pages regardless
+    SCRAPE_FULL_RESCAN_EVERY: int = 15
+    # Seconds a search snapshot is kept in Redis
+    SCRAPE_SNAPSHOT_TTL: int = 60 * 60
+    # Skip /send-ads when a search's parsed ads match the last cycle that was delivered
+    SCRAPE_FINGERPRINT: bool = False
+    # Seconds a search fingerprint is kept in Redis
+    SCRAPE_FINGERPRINT_TTL: int = 60 * 60
+    # Drop ads a chat was already sent before posting to /send-ads
+    SCRAPE_DEDUP: bool = False
+    # Seconds a delisted ad stays in a chat's seen set
+    SCRAPE_DEDUP_TTL: int = 60 * 60 * 24 * 7
+    # Crawl broad categories once and match each user's range filters locally
+    SCRAPE_INDEX: bool = False
+    # Post results for many chats in one /send-ads-batch request, as JSON or msgpack
+    SCRAPE_SEND_BATCH: bool = False
+    SCRAPE_SEND_FORMAT: Literal["json", "msgpack"] = "json"
+    SCRAPE_SEND_GZIP: bool = True
+    # Largest /send-ads-batch body accepted, as sent and once decompressed
+    SEND_BATCH_MAX_BYTES: int = 8 * 1024 * 1024
+    SEND_BATCH_MAX_DECOMPRESSED: int = 64 * 1024 * 1024
+    # Poll each search on its own schedule, sooner after its ads change and backing off while quiet
+    SCRAPE_ADAPTIVE: bool = False
+    # Polling interval bounds in seconds and the backoff factor per quiet poll
+    SCRAPE_POLL_MIN: float = 120.0
+    SCRAPE_POLL_MAX: float = 30 * 60.0
+    SCRAPE_POLL_BACKOFF: float = 1.5
+    # Seconds between dispatcher runs popping due searches
+    SCRAPE_POLL_TICK: float = 30.0
+    # Lease each search while it runs so it isn't queued again on top of itself
+    SCRAPE_LEASES: bool = True
+    # Seconds before a lease held by a crashed worker lapses
+    SCRAPE_LEASE_TTL: int = 10 * 60
+    # Broker messages waiting above which a cycle is deferred once, then skipped (0 disables)
+    SCRAPE_MAX_BACKLOG: int = 500
+    SCRAPE_DEFER_SECONDS: int = 30
+    # Standalone engine (python -m tasks.engine): searches in flight and seconds between cycles
+    SCRAPE_ENGINE_CONCURRENCY: int = 200
+    SCRAPE_ENGINE_INTERVAL: float = 120.0
+    # Pages in flight per host on the async path, 0 for no limit
+    SCRAPE_HOST_CONCURRENCY: int = 0
+    # Requests in flight per async curl_cffi session (one session per host)
+    SCRAPE_MAX_CLIENTS: int = 100
+    # Threads the async path runs its blocking Redis calls on
+    SCRAPE_REDIS_THREADS: int = 32
+    # Searches packed into one Celery task per shard (1 sends a task per search) and run concurrently
+    SCRAPE_BATCH_SIZE: int = 1
+    SCRAPE_BATCH_CONCURRENCY: int = 20
+    # Drop batch results instead of storing one summary per batch in the result backend
+    SCRAPE_BATCH_IGNORE_RESULT: bool = False
+    # This worker's shard, it consumes the scrape.<shard> queue and joins the hash ring
+    SCRAPE_SHARD: str | None = None
+    # Seconds without a heartbeat before a shard leaves the ring
+    SCRAPE_SHARD_TTL: int = 60
+    # Points per shard on the consistent hash ring
+    SCRAPE_RING_REPLICAS: int = 64
+    # Retries per page on 429/5xx or transport errors, with jittered exponential backoff
+    SCRAPE_RETRIES: int = 3
+    SCRAPE_BACKOFF_BASE: float = 1.0
+    SCRAPE_BACKOFF_CAP: float = 30.0
+    # Shared token bucket per host across all workers, rates in requests/sec
+    SCRAPE_RATE_LIMIT: bool = False
+    SCRAPE_RATE: float = 2.0
+    SCRAPE_RATE_MIN: float = 0.2
+    SCRAPE_RATE_MAX: float = 10.0
+    SCRAPE_RATE_STEP: float = 0.1
+    SCRAPE_BURST: int = 5
+    # Responses slower than this many seconds trim the rate
+    SCRAPE_SLOW_RESPONSE: float = 3.0
 
 
 settings = Settings()  # type: ignore
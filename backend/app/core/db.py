@@ -1,5 +1,9 @@
+import time
+from typing import Any
+
 from sqlmodel import select
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
@@ -7,16 +11,76 @@ from app import crud
 from app.core.config import settings
 from app.models import User, UserCreate
 
+
+class PoolMetrics:
+    """Connection checkouts and how long they waited for a free connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        self.checkouts += 1
+        self.timeouts += timed_out
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def stats(self, pool: AsyncAdaptedQueuePool) -> dict[str, Any]:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else None,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
+
+
 # Use an async engine
 DATABASE_URL = str(settings.SQLALCHEMY_DATABASE_URI)
-engine = create_async_engine(DATABASE_URL, pool_size=10)
+engine = create_async_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={
+        # Prepared statements kept per connection, so hot lookups skip the parse/plan round trip
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    },
+)
 
-# AsyncSession maker
+# AsyncSession maker, shared by request dependencies and bot handlers
 AsyncSessionLocal = async_sessionmaker(
     engine, class_=AsyncSession
 )
 
 
+def pool_stats() -> dict[str, Any]:
+    return pool_metrics.stats(engine.sync_engine.pool)
+
+
 # make sure all SQLModel models are imported (app.models) before initializing DB
 # otherwise, SQLModel might fail to initialize relationships properly
 
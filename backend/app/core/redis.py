@@ -0,0 +1,11 @@
+from functools import lru_cache
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+
+
+@lru_cache
+def get_redis() -> Redis:
+    # One client and connection pool per API process
+    return Redis.from_url(settings.REDIS_URL)
@@ -1,12 +1,28 @@
+import uuid
 from typing import Any
+from datetime import datetime
 
 from sqlmodel import select
+from sqlalchemy import BigInteger, Uuid, any_, bindparam, delete, func, tuple_
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import User, UserCreate, UserUpdate
+from app.models import SeenAd, User, UserCreate, UserUpdate
+from app.user_cache import user_cache
 from app.core.security import get_password_hash, verify_password
 
 
+def _bigint_array(name: str, values: list[int]):
+    # One array parameter instead of one per value, so the statement and its
+    # prepared plan stay the same whatever the number of values
+    return bindparam(name, values, type_=ARRAY(BigInteger))
+
+
+def _uuid_array(name: str, values: list[uuid.UUID]):
+    return bindparam(name, values, type_=ARRAY(Uuid()))
+
+
 async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
     db_obj = User.model_validate(
         user_create, update={"password_hash": get_password_hash(user_create.password)}
@@ -14,6 +30,7 @@ async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User
     session.add(db_obj)
     await session.commit()
     await session.refresh(db_obj)
+    await user_cache.invalidate(user_cache.keys_for(db_obj))
     return db_obj
 
 
@@ -24,23 +41,74 @@ async def update_user(*, session: AsyncSession, db_user: User, user_in: UserUpda
         password = user_data["password"]
         password_hash = get_password_hash(password)
         extra_data["password_hash"] = password_hash
+    # Cached under the old and the new chat_id/email
+    stale_keys = user_cache.keys_for(db_user)
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     await session.commit()
     await session.refresh(db_user)
+    await user_cache.invalidate(stale_keys + user_cache.keys_for(db_user))
     return db_user
 
 
+async def cached_user(*, session: AsyncSession, field: str, value: Any) -> User | None:
+    # Attach the cached row to the session as if it had just been loaded
+    data = user_cache.get(field, value)
+    if data is None:
+        return None
+    db_user = User(**data)
+    make_transient_to_detached(db_user)
+    return await session.merge(db_user, load=False)
+
+
 async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
+    if db_user := await cached_user(session=session, field="email", value=email):
+        return db_user
     statement = select(User).where(User.email == email)
     session_user = await session.execute(statement)
-    return session_user.scalars().first()
+    db_user = session_user.scalars().first()
+    if db_user:
+        user_cache.put(db_user)
+    return db_user
 
 
 async def get_user_by_chat_id(*, session: AsyncSession, chat_id: int) -> User | None:
+    if db_user := await cached_user(session=session, field="chat_id", value=chat_id):
+        return db_user
     statement = select(User).where(User.chat_id == chat_id)
     session_user = await session.execute(statement)
-    return session_user.scalars().first()
+    db_user = session_user.scalars().first()
+    if db_user:
+        user_cache.put(db_user)
+    return db_user
+
+
+async def get_users_by_chat_ids(*, session: AsyncSession, chat_ids: list[int]) -> list[User]:
+    statement = select(User).where(User.chat_id == any_(_bigint_array("chat_ids", chat_ids)))
+    session_users = await session.execute(statement)
+    return list(session_users.scalars().all())
+
+
+async def get_dispatch_page(
+    *, session: AsyncSession, after: uuid.UUID | None, limit: int
+) -> list[tuple[uuid.UUID, int, str]]:
+    """Next page of (id, chat_id, mobili_url) for users with an active search, keyset paginated on id."""
+
+    statement = (
+        select(User.id, User.chat_id, User.mobili_url)
+        .where(
+            User.is_active == True,
+            User.is_task_active == True,
+            User.chat_id.is_not(None),
+            User.mobili_url.is_not(None),
+        )
+        .order_by(User.id)
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(User.id > after)
+    result = await session.execute(statement)
+    return [tuple(row) for row in result.all()]
 
 
 async def authenticate(*, session: AsyncSession, email: str, password: str) -> User | None:
@@ -50,3 +118,71 @@ async def authenticate(*, session: AsyncSession, email: str, password: str) -> U
     if not verify_password(password, db_user.password_hash):
         return None
     return db_user
+
+
+async def has_seen_ads(*, session: AsyncSession, user_id: uuid.UUID) -> bool:
+    statement = select(SeenAd.ad_id).where(SeenAd.user_id == user_id).limit(1)
+    result = await session.execute(statement)
+    return result.first() is not None
+
+
+async def users_with_seen_ads(*, session: AsyncSession, user_ids: list[uuid.UUID]) -> set[uuid.UUID]:
+    statement = select(SeenAd.user_id).where(SeenAd.user_id == any_(_uuid_array("user_ids", user_ids))).distinct()
+    result = await session.execute(statement)
+    return set(result.scalars().all())
+
+
+async def record_seen_ads(
+    *, session: AsyncSession, user_id: uuid.UUID, ad_ids: list[int], prune_before: datetime
+) -> set[int]:
+    """Store the user's current ads and return the IDs that weren't seen before.
+
+    Rows first seen before `prune_before` are dropped once the ad is no longer
+    in the user's results. Nothing is committed, so the caller can queue the
+    notifications for the new ads first."""
+
+    new_ids = await record_seen_ads_batch(
+        session=session, ad_ids={user_id: ad_ids}, prune_before=prune_before
+    )
+    return new_ids[user_id]
+
+
+async def record_seen_ads_batch(
+    *, session: AsyncSession, ad_ids: dict[uuid.UUID, list[int]], prune_before: datetime
+) -> dict[uuid.UUID, set[int]]:
+    """Batch variant of `record_seen_ads` for many users in one transaction."""
+
+    user_ids, seen_ids = [], []
+    for user_id, ids in ad_ids.items():
+        for ad_id in dict.fromkeys(ids):
+            user_ids.append(user_id)
+            seen_ids.append(ad_id)
+
+    new_ids: dict[uuid.UUID, set[int]] = {user_id: set() for user_id in ad_ids}
+    if seen_ids:
+        # Rows come from unnesting two arrays, one statement for any batch size
+        rows = func.unnest(
+            _uuid_array("user_ids", user_ids), _bigint_array("ad_ids", seen_ids)
+        ).table_valued("user_id", "ad_id").render_derived()
+        statement = (
+            insert(SeenAd)
+            .from_select(["user_id", "ad_id"], select(rows.c.user_id, rows.c.ad_id))
+            .on_conflict_do_nothing()
+            .returning(SeenAd.user_id, SeenAd.ad_id)
+        )
+        result = await session.execute(statement)
+        for user_id, ad_id in result.all():
+            new_ids[user_id].add(ad_id)
+
+    # Old rows for ads no longer in their user's results
+    current = func.unnest(
+        _uuid_array("current_user_ids", user_ids), _bigint_array("current_ad_ids", seen_ids)
+    ).table_valued("user_id", "ad_id").render_derived()
+    await session.execute(
+        delete(SeenAd).where(
+            SeenAd.user_id == any_(_uuid_array("user_ids", list(ad_ids))),
+            SeenAd.first_seen < prune_before,
+            tuple_(SeenAd.user_id, SeenAd.ad_id).not_in(select(current.c.user_id, current.c.ad_id)),
+        )
+    )
+    return new_ids
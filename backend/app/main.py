@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import sentry_sdk
@@ -7,6 +8,8 @@ from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.routes import bot
+from app.outbox import OutboxConsumer
+from app.user_cache import user_cache
 from app.core.db import init_db
 from app.core.config import settings
 from app.api.main import api_router
@@ -34,8 +37,25 @@ async def lifespan(app: FastAPI):
     logger.info("Creating initial data")
     await init_db() 
     logger.info("Done")
+
+    consumer = None
+    if settings.NOTIFY_QUEUE and settings.NOTIFY_CONSUMER_IN_API:
+        logger.info("Starting notification outbox consumer")
+        consumer = asyncio.create_task(OutboxConsumer(bot.bot_app.bot).run())
+
+    listener = None
+    if settings.USER_CACHE_PUBSUB:
+        # Drop users other replicas changed
+        listener = asyncio.create_task(user_cache.listen())
     yield
 
+    if consumer:
+        consumer.cancel()
+    if listener:
+        listener.cancel()
+    # Close the bot's connection pool
+    await bot.bot_app.shutdown()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -1,8 +1,11 @@
+import re
 import uuid
+from typing import NamedTuple
+from datetime import datetime, timezone
 
 from pydantic import EmailStr
 from sqlmodel import Field, SQLModel
-from sqlalchemy import Column, BigInteger
+from sqlalchemy import Column, BigInteger, DateTime, ForeignKey, func
 
 
 # Shared properties
@@ -19,7 +22,20 @@ class User(UserBase, table=True):
     mobili_url: str | None = Field(default=None)
     chat_id: int | None = Field(default=None, sa_column=Column(BigInteger, nullable=True, index=True))
     is_task_active: bool = Field(default=False)
-    previous_ads: str = Field(default='[]')
+
+
+# Ads already sent to a user, keyed by listing ID
+class SeenAd(SQLModel, table=True):
+    __tablename__ = "seen_ad"
+
+    user_id: uuid.UUID = Field(
+        sa_column=Column(ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    )
+    ad_id: int = Field(sa_column=Column(BigInteger, primary_key=True))
+    first_seen: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now())
+    )
 
 
 # Properties to receive via API on creation
@@ -40,7 +56,6 @@ class UserUpdate(UserBase):
     mobili_url: str | None = Field(default=None)
     chat_id: int | None = Field(default=None, sa_column=Column(BigInteger, nullable=True, index=True))
     is_active: bool = Field(default=True)
-    previous_ads: str = Field(default=None)
 
 
 class UserUpdateMe(SQLModel):
@@ -68,13 +83,53 @@ class TaskUserResponse(SQLModel):
     users: list[dict[str, int | str]]
 
 
+# Listing ID in ad URLs, e.g. /auto-oglasi/24000000/volkswagen-golf
+AD_ID_RE = re.compile(r"/auto-oglasi/(\d+)")
+
+
+class Ad(NamedTuple):
+    """Compact listing record, keyed by the numeric listing ID from its URL."""
+    id: int
+    name: str
+    url: str
+    image: str | None = None
+    production_date: str | None = None
+    price: float | None = None
+    mileage: float | None = None
+    engine_volume: float | None = None
+    power: float | None = None
+
+    @staticmethod
+    def id_from_url(url: str) -> int | None:
+        match = AD_ID_RE.search(url)
+        return int(match.group(1)) if match else None
+
+    @property
+    def caption(self) -> str:
+        return f"Name: {self.name}\nURL: {self.url}\nProduction Date: {self.production_date}"
+
+
 class TaskRequest(SQLModel):
     celery_auth: str
 
 
 class AdsRequest(TaskRequest):
     chat_id: int
-    ads: list[str]
+    ads: list[Ad]
+    # Every current ad ID, when `ads` only holds the ones the worker hadn't sent yet
+    ad_ids: list[int] | None = None
+
+
+class ChatAds(SQLModel):
+    chat_id: int
+    ads: list[Ad]
+    # Every current ad ID, when `ads` only holds the ones the worker hadn't sent yet
+    ad_ids: list[int] | None = None
+
+
+# Results for many chats in one request
+class AdsBatchRequest(TaskRequest):
+    results: list[ChatAds]
 
 
 # JSON payload containing access token
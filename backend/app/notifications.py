@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from app.models import Ad
+from app.core.config import settings
+
+
+# Telegram API limits
+MAX_TEXT_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+MAX_MEDIA_GROUP = 10
+# Image URL -> Telegram file_id of an already uploaded photo
+FILE_ID_CACHE_SIZE = 10000
+
+
+@dataclass
+class SendReport:
+    delivered: int = 0
+    failed: int = 0
+    retried: int = 0
+    # Failed messages Telegram refused for good, a blocked bot or an unusable message
+    rejected: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"delivered {self.delivered}, failed {self.failed}, "
+            f"retried {self.retried}, rejected {self.rejected}"
+        )
+
+
+@dataclass
+class Outgoing:
+    """One Bot API call, a text message or a group of (image URL, caption) photos."""
+    text: str | None = None
+    photos: list[tuple[str, str]] = field(default_factory=list)
+
+    def as_text(self) -> "Outgoing":
+        return Outgoing(text="\n\n".join(caption for _, caption in self.photos)[:MAX_TEXT_LENGTH])
+
+
+def build_messages(ads: list[Ad]) -> list[Outgoing]:
+    """Pack ads into messages according to TELEGRAM_BATCH_MODE.
+
+    "single" sends one text message per ad, "digest" packs up to
+    TELEGRAM_BATCH_SIZE captions into one text message and "media" sends them
+    as photo albums, with ads lacking an image going into a digest."""
+
+    mode = settings.TELEGRAM_BATCH_MODE
+    size = settings.TELEGRAM_BATCH_SIZE
+    if mode == "single":
+        return [Outgoing(text=ad.caption) for ad in ads]
+
+    messages: list[Outgoing] = []
+    if mode == "media":
+        size = min(size, MAX_MEDIA_GROUP)
+        with_image = [ad for ad in ads if ad.image]
+        for i in range(0, len(with_image), size):
+            messages.append(Outgoing(photos=[
+                (ad.image, ad.caption[:MAX_CAPTION_LENGTH]) for ad in with_image[i:i + size]
+            ]))
+        ads = [ad for ad in ads if not ad.image]
+
+    # Digest, split on the batch size and the message length limit
+    chunk: list[str] = []
+    length = 0
+    for ad in ads:
+        caption = ad.caption[:MAX_TEXT_LENGTH]
+        if chunk and (len(chunk) == size or length + len(caption) + 2 > MAX_TEXT_LENGTH):
+            messages.append(Outgoing(text="\n\n".join(chunk)))
+            chunk, length = [], 0
+        chunk.append(caption)
+        length += len(caption) + 2
+    if chunk:
+        messages.append(Outgoing(text="\n\n".join(chunk)))
+    return messages
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class Notifier:
+    """Sends messages to many chats concurrently within Telegram's flood limits.
+
+    Every send takes a slot from a bot-wide limiter, and each chat gets at most
+    one message per TELEGRAM_CHAT_INTERVAL. Chats are drained concurrently,
+    one sender per chat across all requests. Flood-control responses pause the
+    chat for `retry_after` and requeue the message instead of dropping it."""
+
+    def __init__(self):
+        self._global = RateLimiter(settings.TELEGRAM_GLOBAL_RATE)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_next: dict[int, float] = {}
+        self._file_ids: OrderedDict[str, str] = OrderedDict()
+
+    async def _chat_slot(self, chat_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self._chat_next.get(chat_id, 0.0) - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._global.wait()
+        self._chat_next[chat_id] = loop.time() + settings.TELEGRAM_CHAT_INTERVAL
+
+    async def _deliver(self, bot: Bot, chat_id: int, message: Outgoing) -> None:
+        if not message.photos:
+            await bot.send_message(chat_id=chat_id, text=message.text)
+            return
+
+        # Reuse uploaded photos so Telegram doesn't fetch the same image again
+        media = [
+            InputMediaPhoto(self._file_ids.get(url, url), caption=caption)
+            for url, caption in message.photos
+        ]
+        if len(media) == 1:
+            sent = [await bot.send_photo(
+                chat_id=chat_id, photo=media[0].media, caption=media[0].caption
+            )]
+        else:
+            sent = await bot.send_media_group(chat_id=chat_id, media=media)
+
+        for (url, _), result in zip(message.photos, sent):
+            if result.photo:
+                self._file_ids[url] = result.photo[-1].file_id
+                self._file_ids.move_to_end(url)
+        while len(self._file_ids) > FILE_ID_CACHE_SIZE:
+            self._file_ids.popitem(last=False)
+
+    async def _drain(
+        self, bot: Bot, chat_id: int, queue: deque[Outgoing], report: SendReport, retries: int
+    ) -> None:
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            attempts = 0
+            while queue:
+                await self._chat_slot(chat_id)
+                try:
+                    await self._deliver(bot, chat_id, queue[0])
+                except RetryAfter as e:
+                    # Flood control, wait it out and send the same message again
+                    delay = float(e.retry_after)
+                    self._chat_next[chat_id] = asyncio.get_running_loop().time() + delay
+                    attempts += 1
+                    report.retried += 1
+                    logging.warning(f"Flood control for {chat_id}, retrying in {delay}s")
+                except BadRequest as e:
+                    if queue[0].photos:
+                        # Telegram couldn't use an image, send the captions as text instead
+                        logging.warning(f"Falling back to text for {chat_id}: {str(e)}")
+                        queue[0] = queue[0].as_text()
+                        report.retried += 1
+                        continue
+                    logging.warning(f"Failed to send to {chat_id}: {str(e)}")
+                    report.failed += 1
+                    report.rejected += 1
+                    queue.popleft()
+                    attempts = 0
+                    continue
+                except Forbidden as e:
+                    # Blocked bot or deleted chat, retrying won't help
+                    logging.warning(f"Failed to send to {chat_id}: {str(e)}")
+                    report.failed += 1
+                    report.rejected += 1
+                    queue.popleft()
+                    attempts = 0
+                    continue
+                except NetworkError as e:
+                    attempts += 1
+                    report.retried += 1
+                    self._chat_next[chat_id] = asyncio.get_running_loop().time() + 2 ** attempts
+                    logging.warning(f"Network error sending to {chat_id}: {str(e)}")
+                except Exception as e:
+                    logging.warning(f"Failed to send to {chat_id}: {str(e)}")
+                    report.failed += 1
+                    queue.popleft()
+                    attempts = 0
+                    continue
+                else:
+                    report.delivered += 1
+                    queue.popleft()
+                    attempts = 0
+                    continue
+
+                # Give up on a message after too many retries
+                if attempts > retries:
+                    report.failed += 1
+                    queue.popleft()
+                    attempts = 0
+
+    async def send(
+        self, bot: Bot, messages: list[tuple[int, Outgoing]], retries: int | None = None
+    ) -> SendReport:
+        """Send (chat_id, message) pairs, keeping each chat's messages in order.
+
+        Flood-control and network errors are retried up to `retries` times,
+        TELEGRAM_MAX_RETRIES by default."""
+
+        if retries is None:
+            retries = settings.TELEGRAM_MAX_RETRIES
+
+        queues: dict[int, deque[Outgoing]] = {}
+        for chat_id, message in messages:
+            queues.setdefault(chat_id, deque()).append(message)
+
+        report = SendReport()
+        await asyncio.gather(
+            *(self._drain(bot, chat_id, queue, report, retries) for chat_id, queue in queues.items())
+        )
+        return report
+
+
+notifier = Notifier()
@@ -0,0 +1,123 @@
+"""Durable queue of outbound Telegram notifications on a Redis Stream.
+
+`/send-ads` enqueues messages for new ads and consumers in one group deliver
+them, acking only once handled. Failed entries are re-added until
+NOTIFY_MAX_ATTEMPTS and then dead-lettered, straight away when Telegram
+rejected them for good, and entries left pending by a dead consumer are
+claimed by another. Runs in the API lifespan or on its own:
+
+    python -m app.outbox
+"""
+import json
+import socket
+import asyncio
+import logging
+from dataclasses import asdict
+
+from redis.exceptions import ResponseError
+from telegram import Bot
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.notifications import Outgoing, notifier
+
+
+STREAM = "notify:outbox"
+DEAD_LETTER_STREAM = "notify:dead"
+GROUP = "notifiers"
+
+
+async def enqueue(chat_id: int, messages: list[Outgoing]) -> None:
+    pipe = get_redis().pipeline(transaction=False)
+    for message in messages:
+        pipe.xadd(
+            STREAM,
+            {"chat_id": chat_id, "message": json.dumps(asdict(message)), "attempts": 0},
+            maxlen=settings.NOTIFY_STREAM_MAXLEN,
+            approximate=True,
+        )
+    await pipe.execute()
+
+
+class OutboxConsumer:
+    def __init__(self, bot: Bot, name: str | None = None):
+        self.bot = bot
+        self.name = name or f"{socket.gethostname()}-{id(self)}"
+        self.redis = get_redis()
+
+    async def setup(self) -> None:
+        try:
+            await self.redis.xgroup_create(STREAM, GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            # Group already exists
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def handle(self, entry_id: bytes, fields: dict[bytes, bytes]) -> None:
+        chat_id = int(fields[b"chat_id"])
+        attempts = int(fields.get(b"attempts", 0))
+        data = json.loads(fields[b"message"])
+        message = Outgoing(text=data["text"], photos=[tuple(photo) for photo in data["photos"]])
+
+        # One attempt per read, retries go back through the stream. Retrying in
+        # here could outlast NOTIFY_CLAIM_IDLE_MS and let another consumer
+        # claim and send the same entry meanwhile.
+        report = await notifier.send(self.bot, [(chat_id, message)], retries=0)
+
+        pipe = self.redis.pipeline()
+        if not report.delivered:
+            attempts += 1
+            retry = {b"chat_id": chat_id, b"message": fields[b"message"], b"attempts": attempts}
+            if report.rejected or attempts >= settings.NOTIFY_MAX_ATTEMPTS:
+                logging.warning(f"Dead-lettering notification for {chat_id} after {attempts} attempt(s)")
+                pipe.xadd(DEAD_LETTER_STREAM, retry, maxlen=settings.NOTIFY_STREAM_MAXLEN, approximate=True)
+            else:
+                pipe.xadd(STREAM, retry, maxlen=settings.NOTIFY_STREAM_MAXLEN, approximate=True)
+        pipe.xack(STREAM, GROUP, entry_id)
+        pipe.xdel(STREAM, entry_id)
+        await pipe.execute()
+
+    async def read(self) -> list[tuple[bytes, dict]]:
+        # Entries a dead consumer left behind come first
+        _, claimed, *_ = await self.redis.xautoclaim(
+            STREAM, GROUP, self.name,
+            min_idle_time=settings.NOTIFY_CLAIM_IDLE_MS,
+            count=settings.NOTIFY_BATCH,
+        )
+        # Entries deleted while pending come back without fields
+        claimed = [(entry_id, fields) for entry_id, fields in claimed if fields]
+        if claimed:
+            return claimed
+        response = await self.redis.xreadgroup(
+            GROUP, self.name, {STREAM: ">"},
+            count=settings.NOTIFY_BATCH, block=5000,
+        )
+        return response[0][1] if response else []
+
+    async def run(self) -> None:
+        await self.setup()
+        logging.info(f"Outbox consumer {self.name} started")
+        while True:
+            try:
+                entries = await self.read()
+                await asyncio.gather(*(self.handle(entry_id, fields) for entry_id, fields in entries))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Outbox consumer error: {str(e)}")
+                await asyncio.sleep(1)
+
+
+async def main() -> None:
+    from app.api.routes.bot import bot_app
+
+    async with bot_app.bot as bot:
+        await OutboxConsumer(bot).run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s: %(message)s"
+    )
+    asyncio.run(main())
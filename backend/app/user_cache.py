@@ -0,0 +1,97 @@
+"""TTL + LRU cache of user rows looked up by chat_id or email.
+
+Rows are cached as plain column values and merged into the caller's session
+without a query, so cached users behave like freshly loaded ones. Writes
+through `crud` invalidate them. With USER_CACHE_PUBSUB on, invalidations are
+also published over Redis so every API replica drops the same keys.
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Any
+from collections import OrderedDict
+
+from app.models import User
+from app.core.config import settings
+from app.core.redis import get_redis
+
+
+CHANNEL = "users:invalidate"
+# Lookup fields the cache is keyed by
+FIELDS = ("chat_id", "email")
+
+
+class UserCache:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, Any], tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def keys_for(user: User) -> list[tuple[str, Any]]:
+        return [(field, getattr(user, field)) for field in FIELDS if getattr(user, field) is not None]
+
+    def get(self, field: str, value: Any) -> dict | None:
+        entry = self._entries.get((field, value))
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[(field, value)]
+            self.misses += 1
+            return None
+        self._entries.move_to_end((field, value))
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user: User) -> None:
+        data = user.model_dump()
+        expires = time.monotonic() + self.ttl
+        for key in self.keys_for(user):
+            self._entries[key] = (expires, data)
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def evict(self, keys: list[tuple[str, Any]]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def invalidate(self, keys: list[tuple[str, Any]]) -> None:
+        self.evict(keys)
+        if settings.USER_CACHE_PUBSUB and keys:
+            try:
+                await get_redis().publish(CHANNEL, json.dumps(keys))
+            except Exception as e:
+                logging.warning(f"Failed to publish user cache invalidation: {str(e)}")
+
+    async def listen(self) -> None:
+        """Evict keys invalidated by other replicas, run for the app's lifetime."""
+
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.evict([tuple(key) for key in json.loads(message["data"])])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"User cache invalidation listener error: {str(e)}")
+                # Anything published meanwhile was missed
+                self._entries.clear()
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
@@ -0,0 +1,120 @@
+"""Bot API send latency, a new Bot per call versus the shared pooled bot.
+
+Offline by default against a local Bot API stand-in that charges a simulated
+handshake on every new connection. Pass --live with BOT_TOKEN set and a chat ID
+to measure against api.telegram.org instead.
+
+    python -m benchmarks.bench_bot --messages 50 --handshake 0.15
+    python -m benchmarks.bench_bot --live 123456789 --messages 10
+"""
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram import Bot
+
+from app.core.config import settings
+from app.api.routes.bot import telegram_request
+
+
+TOKEN = "123456:offline"
+MESSAGE = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ad"}
+ME = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class BotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "BotAPIServer"
+
+    def setup(self) -> None:
+        # Once per connection, stands in for the TCP + TLS handshake
+        time.sleep(self.server.handshake)
+        self.server.connections += 1
+        super().setup()
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        result = ME if self.path.endswith("/getMe") else MESSAGE
+        body = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class BotAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handshake: float):
+        super().__init__(("127.0.0.1", 0), BotAPIHandler)
+        self.handshake = handshake
+        self.connections = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+
+async def per_call(token: str, base_url: str, chat_id: int, messages: int) -> list[float]:
+    # What /send-ads used to do, a fresh Bot and connection pool for every request
+    timings = []
+    for i in range(messages):
+        start = time.perf_counter()
+        bot = Bot(token, base_url=base_url)
+        await bot.send_message(chat_id=chat_id, text=f"ad {i}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def shared(token: str, base_url: str, chat_id: int, messages: int) -> list[float]:
+    timings = []
+    async with Bot(token, base_url=base_url, request=telegram_request()) as bot:
+        for i in range(messages):
+            start = time.perf_counter()
+            await bot.send_message(chat_id=chat_id, text=f"ad {i}")
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+    print(f"{name:>9}: median {statistics.median(timings) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--handshake", type=float, default=0.1)
+    parser.add_argument("--live", type=int, metavar="CHAT_ID")
+    args = parser.parse_args()
+
+    if args.live:
+        token, base_url, chat_id, server = settings.BOT_TOKEN, "https://api.telegram.org/bot", args.live, None
+    else:
+        server = BotAPIServer(args.handshake)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        token, base_url, chat_id = TOKEN, server.base_url, 1
+
+    for name, bench in (("per-call", per_call), ("shared", shared)):
+        opened = server.connections if server else 0
+        report(name, asyncio.run(bench(token, base_url, chat_id, args.messages)))
+        if server:
+            print(f"{'':>9}  {server.connections - opened} connection(s) opened")
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
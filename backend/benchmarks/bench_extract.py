@@ -0,0 +1,47 @@
+"""Microbenchmark for the results page extractors.
+
+Runs the fast byte-scanning extractor and the BeautifulSoup fallback over saved
+results pages and reports pages/sec and peak memory for each.
+
+    python -m benchmarks.bench_extract saved/page1.html saved/page2.html
+    python -m benchmarks.bench_extract --rounds 50   # pages from the corpus
+"""
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+from tasks.extract import extract_bs4, extract_fast
+from benchmarks.corpus import load_pages
+
+
+def bench(extractor, pages: list[bytes], rounds: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            extractor(page)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "pages_per_sec": len(pages) * rounds / elapsed,
+        "peak_kib": peak / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", type=Path, help="saved results pages (HTML)")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = [path.read_bytes() for path in args.pages] or load_pages()
+
+    for name, extractor in (("fast", extract_fast), ("bs4", extract_bs4)):
+        result = bench(extractor, pages, args.rounds)
+        print(f"{name:>5}: {result['pages_per_sec']:10.1f} pages/sec  peak {result['peak_kib']:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
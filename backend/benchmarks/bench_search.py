@@ -0,0 +1,115 @@
+"""Offline scraper throughput benchmark.
+
+Runs `fetch_ads` (and the async variant) against the local stand-in server
+and reports per-search wall time, pages/sec, parse time and allocations. No
+network access is needed, so it can run in CI.
+
+    python -m benchmarks.bench_search --pages 15 --latency 0.1 --searches 5
+    python -m benchmarks.bench_search --mode async --error-rate 0.05
+"""
+import time
+import argparse
+import statistics
+import tracemalloc
+
+from app.core.config import settings
+from benchmarks.server import CorpusServer
+from tasks import search
+from tasks.sessions import pool
+
+
+SEARCH_PATH = "/auto-oglasi/pretraga?brand=volkswagen&model%5B%5D=golf&sort=renewDate_desc&tag=true"
+
+
+class ParseTimer:
+    """Wraps the scraper's page parser to time it."""
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.elapsed = 0.0
+
+    def __call__(self, content: bytes):
+        start = time.perf_counter()
+        try:
+            return self.parse(content)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+def run(server: CorpusServer, mode: str, searches: int) -> list[dict]:
+    search_url = server.url + SEARCH_PATH
+    timer = ParseTimer(search.parse_page)
+    search.parse_page = timer
+
+    results = []
+    try:
+        for _ in range(searches):
+            server.requests = 0
+            timer.elapsed = 0.0
+            tracemalloc.start()
+            start = time.perf_counter()
+            if mode == "async":
+                ads = pool.run(search.fetch_ads_async(search_url))
+            else:
+                ads = search.fetch_ads(search_url)
+            wall = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append({
+                "wall": wall,
+                "pages": server.requests,
+                "ads": len(ads),
+                "parse": timer.elapsed,
+                "allocated_kib": current / 1024,
+                "peak_kib": peak / 1024,
+            })
+    finally:
+        search.parse_page = timer.parse
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default="synthetic")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--searches", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int)
+    args = parser.parse_args()
+
+    # Keep retries fast and the Redis-backed features out of the measurement
+    settings.SCRAPE_BACKOFF_BASE = 0.01
+    settings.SCRAPE_RATE_LIMIT = False
+    settings.SCRAPE_INCREMENTAL = False
+    settings.SCRAPE_FINGERPRINT = False
+    if args.concurrency:
+        settings.SCRAPE_CONCURRENCY = args.concurrency
+
+    server = CorpusServer(
+        corpus=args.corpus, pages=args.pages, latency=args.latency,
+        jitter=args.jitter, error_rate=args.error_rate
+    ).start()
+    try:
+        results = run(server, args.mode, args.searches)
+    finally:
+        server.shutdown()
+        pool.close()
+
+    for i, result in enumerate(results, 1):
+        print(
+            f"search {i}: {result['wall'] * 1000:8.1f} ms  "
+            f"{result['pages'] / result['wall']:7.1f} pages/sec  "
+            f"parse {result['parse'] * 1000:7.1f} ms  "
+            f"{result['ads']:4d} ads  "
+            f"alloc {result['allocated_kib']:8.1f} KiB  peak {result['peak_kib']:8.1f} KiB"
+        )
+    walls = [result["wall"] for result in results]
+    pages = sum(result["pages"] for result in results)
+    print(f"median {statistics.median(walls) * 1000:.1f} ms/search, {pages / sum(walls):.1f} pages/sec overall")
+
+
+if __name__ == "__main__":
+    main()
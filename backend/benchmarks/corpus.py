@@ -0,0 +1,70 @@
+"""Recorded results pages used by the offline benchmarks.
+
+Each search lives in its own directory under benchmarks/corpus as
+page-1.html, page-2.html, ... plus a meta.json describing where it came from.
+New searches are captured with `python -m benchmarks.record`.
+
+    python -m benchmarks.corpus   # regenerate the synthetic search
+"""
+import json
+from pathlib import Path
+
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+PAGE_SIZE = 25
+
+
+def load_pages(name: str = "synthetic") -> list[bytes]:
+    directory = CORPUS_DIR / name
+    paths = sorted(directory.glob("page-*.html"), key=lambda path: int(path.stem.split("-")[1]))
+    return [path.read_bytes() for path in paths]
+
+
+def synthetic_page(page: int = 1, ads: int = PAGE_SIZE, total: int = PAGE_SIZE) -> bytes:
+    # Roughly the shape of a polovniautomobili results page
+    first_id = 24000000 + (page - 1) * ads
+    items = [
+        {
+            "@context": "https://schema.org",
+            "@type": "Car",
+            "name": f" Volkswagen Golf {first_id + i} ",
+            "url": f"https://www.polovniautomobili.com/auto-oglasi/{first_id + i}/volkswagen-golf-1-6-tdi",
+            "image": f"https://photos.polovniautomobili.com/{first_id + i}-1.jpg",
+            "productionDate": str(2005 + i % 15),
+            "offers": {"@type": "Offer", "price": 4000 + i * 50, "priceCurrency": "EUR"},
+        }
+        for i in range(ads)
+    ]
+    articles = "".join(
+        f'<article class="classified ordinaryClassified" data-classifiedid="{first_id + i}">'
+        f'<div class="image"><img src="https://photos.polovniautomobili.com/{first_id + i}-1.jpg"></div>'
+        f'<div class="textContent"><h2><a href="/auto-oglasi/{first_id + i}/volkswagen-golf-1-6-tdi">'
+        f'Volkswagen Golf {first_id + i}</a></h2>'
+        + '<div class="city">Beograd</div><div class="price">4.500 &euro;</div>' * 10
+        + "</div></article>"
+        for i in range(ads)
+    )
+    scripts = (
+        f'<script type="application/ld+json">{json.dumps(items)}</script>'
+        '<script type="application/ld+json">{"@context": "https://schema.org", "@type": "BreadcrumbList"}</script>'
+    )
+    return (
+        '<!DOCTYPE html><html><head><meta name="csrf-token" content="nonce"></head><body>'
+        f'<div class="js-hide-on-filter"><small>Prikazano od {(page - 1) * ads + 1} do {page * ads} '
+        f'oglasa od ukupno {total}</small></div>'
+        f"{articles}{scripts}</body></html>"
+    ).encode()
+
+
+def generate(name: str = "synthetic", pages: int = 3) -> None:
+    directory = CORPUS_DIR / name
+    directory.mkdir(parents=True, exist_ok=True)
+    for page in range(1, pages + 1):
+        (directory / f"page-{page}.html").write_bytes(
+            synthetic_page(page, total=pages * PAGE_SIZE)
+        )
+    (directory / "meta.json").write_text(json.dumps({"url": None, "source": "synthetic", "pages": pages}, indent=2))
+
+
+if __name__ == "__main__":
+    generate()
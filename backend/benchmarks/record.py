@@ -0,0 +1,74 @@
+"""Record and replay results pages for the offline benchmarks.
+
+Record walks a live search the same way the scraper does and saves every
+page into the corpus. Replay serves a saved search back through the local
+stand-in server.
+
+    python -m benchmarks.record record "https://www.polovniautomobili.com/auto-oglasi/pretraga?..." --name golf
+    python -m benchmarks.record replay --name golf --latency 0.3
+"""
+import json
+import argparse
+from datetime import datetime, timezone
+
+from benchmarks.corpus import CORPUS_DIR
+from benchmarks.server import CorpusServer
+
+
+def record(search_url: str, name: str, max_pages: int = 50) -> int:
+    from tasks.limiter import fetch
+    from tasks.extract import parse_page
+    from tasks.search import HEADERS, build_page_url
+
+    directory = CORPUS_DIR / name
+    directory.mkdir(parents=True, exist_ok=True)
+
+    page = 1
+    while page <= max_pages:
+        response = fetch(build_page_url(search_url, page), headers=HEADERS)
+        _, article_count = parse_page(response.content)
+        if not article_count:
+            break
+        (directory / f"page-{page}.html").write_bytes(response.content)
+        print(f"Saved page {page} ({article_count} ads)")
+        page += 1
+
+    (directory / "meta.json").write_text(json.dumps({
+        "url": search_url,
+        "source": "recorded",
+        "pages": page - 1,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }, indent=2))
+    return page - 1
+
+
+def replay(name: str, port: int, latency: float, error_rate: float) -> None:
+    server = CorpusServer(("127.0.0.1", port), name, latency=latency, error_rate=error_rate)
+    print(f"Replaying {name} on {server.url}")
+    server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record")
+    record_parser.add_argument("url")
+    record_parser.add_argument("--name", required=True)
+    record_parser.add_argument("--max-pages", type=int, default=50)
+
+    replay_parser = commands.add_parser("replay")
+    replay_parser.add_argument("--name", required=True)
+    replay_parser.add_argument("--port", type=int, default=8800)
+    replay_parser.add_argument("--latency", type=float, default=0.0)
+    replay_parser.add_argument("--error-rate", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.url, args.name, args.max_pages)
+    else:
+        replay(args.name, args.port, args.latency, args.error_rate)
+
+
+if __name__ == "__main__":
+    main()
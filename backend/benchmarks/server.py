@@ -0,0 +1,120 @@
+"""Local HTTP stand-in for polovniautomobili.com.
+
+Serves a recorded search from the corpus for any results URL, picking the
+page from the `page` query parameter. Pages past `pages` come back empty so
+pagination ends there, and the advertised result count is rewritten to match.
+
+    python -m benchmarks.server --pages 15 --latency 0.2 --error-rate 0.05
+"""
+import re
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.corpus import PAGE_SIZE, load_pages
+
+
+TOTAL_COUNT_RE = re.compile(rb"od\s+ukupno\s+[\d.,]+")
+EMPTY_PAGE = b"<!DOCTYPE html><html><body><div class='no-results'></div></body></html>"
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    server: "CorpusServer"
+
+    def do_GET(self) -> None:
+        query = parse_qs(urlparse(self.path).query)
+        page = int((query.get("page") or ["1"])[0] or 1)
+        self.server.count()
+
+        time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        if random.random() < self.server.error_rate:
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        body = self.server.page(page)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        # Stand-in for /api/send-ads so a full search can run offline
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = b'{"message": "No new ads"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class CorpusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        corpus: str = "synthetic",
+        pages: int | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        super().__init__(address, CorpusHandler)
+        self.corpus = load_pages(corpus)
+        self.pages = pages or len(self.corpus)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def page(self, page: int) -> bytes:
+        if page < 1 or page > self.pages:
+            return EMPTY_PAGE
+        body = self.corpus[(page - 1) % len(self.corpus)]
+        return TOTAL_COUNT_RE.sub(f"od ukupno {self.pages * PAGE_SIZE}".encode(), body)
+
+    def start(self) -> "CorpusServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--corpus", default="synthetic")
+    parser.add_argument("--pages", type=int)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = CorpusServer(
+        ("127.0.0.1", args.port), args.corpus, args.pages,
+        args.latency, args.jitter, args.error_rate
+    )
+    print(f"Serving {args.corpus} on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
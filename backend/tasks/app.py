@@ -1,18 +1,35 @@
 import os
+import json
+import time
+import asyncio
 import logging
 import warnings
-from typing import Any
-from telegram import Bot
+from typing import Any, Iterable, Iterator
 from dotenv import load_dotenv
 from curl_cffi import requests
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown, worker_process_shutdown
 
 from app.models import User
 from app.core.config import settings
 
-from .search import search_main
+from .sessions import pool
+from .fingerprint import pop_stats
+from .search import (
+    search_main,
+    search_main_async,
+    search_shared,
+    search_shared_async,
+    search_category,
+    search_category_async,
+    canonical_search_url,
+)
+from .index import category_url
+from .schedule import schedule
+from . import backpressure
+from .sharding import Heartbeat, current_ring, queue_name
 
 
 
@@ -31,6 +48,13 @@ warnings.filterwarnings(
     message=".*ssl_cert_reqs"
 )
 
+# main and dispatch run off their own queue, every worker consumes it, so a
+# backlog of searches on the default and shard queues can't hold them back
+CONTROL_QUEUE = "control"
+
+# Streamed feed of users with an active search
+QUEUE_TASKS_URL = 'https://auto-nabavka.onrender.com/api/queue-tasks/stream'
+
 # Celery app setup
 celery_app = Celery(
     'tasks',
@@ -43,50 +67,295 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(minute='*/2')
     },
 }
+if settings.SCRAPE_ADAPTIVE:
+    # main only refreshes the schedule, the dispatcher queues searches as they fall due
+    celery_app.conf.beat_schedule['dispatch-due'] = {
+        'task': 'tasks.app.dispatch',
+        'schedule': settings.SCRAPE_POLL_TICK
+    }
+celery_app.conf.task_routes = {
+    'tasks.app.main': {'queue': CONTROL_QUEUE},
+    'tasks.app.dispatch': {'queue': CONTROL_QUEUE},
+}
 celery_app.conf.timezone = 'UTC'
 celery_app.conf.result_expires = 60
 celery_app.conf.broker_connection_retry_on_startup = True
 
 
-# Bot token
-token = os.getenv("BOT_TOKEN")
-bot = Bot(token)
+@worker_process_shutdown.connect
+def close_sessions(**kwargs) -> None:
+    # Report connection reuse before dropping the worker's sessions
+    logging.info(f"Session pool stats: {pool.stats()}")
+    pool.close()
+
+
+def iter_users(response: requests.Response) -> Iterator[dict]:
+    """Users from the NDJSON dispatch feed, parsed as lines arrive."""
+
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+# Set when this worker serves a shard
+heartbeat: Heartbeat | None = None
+
+
+@celeryd_after_setup.connect
+def consume_queues(sender, instance, **kwargs) -> None:
+    instance.app.amqp.queues.select_add(CONTROL_QUEUE)
+    # Searches hashed to this worker's shard arrive on its own queue
+    if settings.SCRAPE_SHARD:
+        instance.app.amqp.queues.select_add(queue_name(settings.SCRAPE_SHARD))
+
+
+@worker_ready.connect
+def join_ring(**kwargs) -> None:
+    global heartbeat
+    if settings.SCRAPE_SHARD:
+        heartbeat = Heartbeat(queue_name(settings.SCRAPE_SHARD))
+        heartbeat.start()
+        logging.info(f"Joined shard ring as {heartbeat.queue}")
+
+
+@worker_shutdown.connect
+def leave_ring(**kwargs) -> None:
+    if heartbeat:
+        heartbeat.stop()
+
+
+def group_searches(users: Iterable[dict]) -> list[dict]:
+    """Group users by canonical search URL so each distinct search is scraped once per cycle."""
+
+    searches: dict[str, dict] = {}
+    for user in users:
+        if not user.get('mobili_url') or not user.get('chat_id'):
+            continue
+        key = canonical_search_url(user['mobili_url'])
+        shared = searches.setdefault(key, {'mobili_url': key, 'chat_ids': []})
+        shared['chat_ids'].append(user['chat_id'])
+    return list(searches.values())
+
+
+def group_categories(users: Iterable[dict]) -> list[dict]:
+    """Group users by the broad category crawl their search is a slice of."""
+
+    categories: dict[str, dict] = {}
+    for user in users:
+        if not user.get('mobili_url') or not user.get('chat_id'):
+            continue
+        key = category_url(canonical_search_url(user['mobili_url']))
+        category = categories.setdefault(key, {'mobili_url': key, 'users': []})
+        category['users'].append({'chat_id': user['chat_id'], 'mobili_url': user['mobili_url']})
+    return list(categories.values())
+
+
+def queue_searches(task: str, payloads: list[dict]) -> int:
+    """Queue search tasks, skipping searches whose previous run still holds the lease.
+
+    Each search goes to the shard queue its URL hashes to on the ring, or the
+    default queue when no worker serves a shard. With SCRAPE_BATCH_SIZE above 1,
+    searches in the same shard are packed into `search_batch` tasks."""
+
+    leased = []
+    for payload in payloads:
+        lease = None
+        if settings.SCRAPE_LEASES:
+            lease = backpressure.acquire_lease(payload['mobili_url'])
+            if lease is None:
+                backpressure.count("lease_skipped")
+                continue
+        leased.append((payload, lease))
+
+    ring = current_ring()
+    size = settings.SCRAPE_BATCH_SIZE
+    if size <= 1:
+        for payload, lease in leased:
+            celery_app.send_task(
+                task, args=[payload], kwargs={'lease': lease},
+                queue=ring.queue_for(payload['mobili_url'])
+            )
+        return len(leased)
+
+    shards: dict[str | None, list[tuple[dict, str | None]]] = {}
+    for payload, lease in leased:
+        shards.setdefault(ring.queue_for(payload['mobili_url']), []).append((payload, lease))
+    for queue, shard in shards.items():
+        for i in range(0, len(shard), size):
+            batch = shard[i:i + size]
+            search_batch.apply_async(
+                args=[task, [payload for payload, _ in batch]],
+                kwargs={'leases': [lease for _, lease in batch]},
+                queue=queue
+            )
+    return len(leased)
 
 
 """Task definitions"""
 @celery_app.task
-def main() -> bool:
+def main(deferred: bool = False) -> bool:
     # Delete expired results
     # celery_app.control.purge()
 
-    # Send request to API endpoint to start task
-    api_url = 'https://auto-nabavka.onrender.com/api/queue-tasks'
-
     # JSON payload
     payload = {
         "celery_auth": os.getenv("CELERY_AUTH")
     }
 
+    # Report fingerprint hits and misses from the previous cycle
+    if settings.SCRAPE_FINGERPRINT:
+        try:
+            logging.info(f"Fingerprint stats: {pop_stats()}")
+        except Exception as e:
+            logging.warning(f"Failed to read fingerprint stats: {str(e)}")
+
+    try:
+        logging.info(f"Dispatch stats: {backpressure.stats()}")
+    except Exception as e:
+        logging.warning(f"Failed to read dispatch stats: {str(e)}")
+
+    # Workers haven't caught up with the last cycle, try once more later, then skip
+    if not settings.SCRAPE_ADAPTIVE and backpressure.backlogged():
+        if deferred:
+            backpressure.count("skipped")
+            return "Skipped cycle, broker backlogged"
+        backpressure.count("deferred")
+        main.apply_async(kwargs={'deferred': True}, countdown=settings.SCRAPE_DEFER_SECONDS)
+        return "Deferred cycle, broker backlogged"
+
     # Sending the POST request to queue tasks
     try:
-        response = requests.post(api_url, json=payload)
+        response = pool.post(QUEUE_TASKS_URL, json=payload, stream=True)
         response.raise_for_status()
-        users = response.json()["data"]
-        count = response.json()["count"]
 
-        if users:
-            logging.info(f"Processing {count} user(s)\n")
-            for user in users:
-                search.apply_async(args=[user])
+        # Users are grouped as the feed streams in, only the groups are kept
+        try:
+            if settings.SCRAPE_INDEX:
+                categories = group_categories(iter_users(response))
+                count = sum(len(category['users']) for category in categories)
+            else:
+                searches = group_searches(iter_users(response))
+                count = sum(len(shared['chat_ids']) for shared in searches)
+        finally:
+            response.close()
+
+        if count and settings.SCRAPE_INDEX:
+            logging.info(f"Processing {count} user(s) across {len(categories)} category crawl(s)\n")
+            if settings.SCRAPE_ADAPTIVE:
+                schedule.sync({category['mobili_url']: (crawl_category.name, category) for category in categories})
+                return True
+            queue_searches(crawl_category.name, categories)
+            return True
+        elif count:
+            logging.info(f"Processing {count} user(s) across {len(searches)} search(es)\n")
+            if settings.SCRAPE_ADAPTIVE:
+                schedule.sync({shared['mobili_url']: (search_group.name, shared) for shared in searches})
+                return True
+            queue_searches(search_group.name, searches)
             return True
         else:
+            if settings.SCRAPE_ADAPTIVE:
+                schedule.sync({})
             return "No users found"
 
     except Exception as e:
         return f"Failed to queue tasks: {str(e)}"
 
 
+@celery_app.task
+def dispatch() -> Any:
+    # Due searches stay due until the workers catch up
+    if backpressure.backlogged():
+        backpressure.count("deferred")
+        return "Deferred, broker backlogged"
+
+    # Queue only the searches whose next run has come
+    try:
+        due = schedule.due()
+    except Exception as e:
+        return f"Failed to read schedule: {str(e)}"
+    by_task: dict[str, list[dict]] = {}
+    for task, payload in due:
+        by_task.setdefault(task, []).append(payload)
+    return sum(queue_searches(task, payloads) for task, payloads in by_task.items())
+
+
 @celery_app.task
 def search(user: User) -> Any:
+    if settings.SCRAPE_ASYNC:
+        return pool.run(search_main_async(user))
     results = search_main(user)
     return results
+
+
+@celery_app.task
+def search_group(search: dict, lease: str | None = None) -> Any:
+    try:
+        if settings.SCRAPE_ASYNC:
+            return pool.run(search_shared_async(search))
+        return search_shared(search)
+    finally:
+        backpressure.release_lease(search['mobili_url'], lease)
+
+
+@celery_app.task
+def crawl_category(category: dict, lease: str | None = None) -> Any:
+    try:
+        if settings.SCRAPE_ASYNC:
+            return pool.run(search_category_async(category))
+        return search_category(category)
+    finally:
+        backpressure.release_lease(category['mobili_url'], lease)
+
+
+# Celery task name -> the coroutine behind it, for running searches in batches
+ASYNC_SEARCHES = {
+    search_group.name: search_shared_async,
+    crawl_category.name: search_category_async,
+}
+
+
+@celery_app.task(ignore_result=settings.SCRAPE_BATCH_IGNORE_RESULT)
+def search_batch(task: str, payloads: list[dict], leases: list[str | None] | None = None) -> dict:
+    """Run many searches in one task, concurrently on the pool's event loop."""
+
+    leases = leases or [None] * len(payloads)
+    start = time.monotonic()
+
+    async def run_all() -> list:
+        slots = asyncio.Semaphore(settings.SCRAPE_BATCH_CONCURRENCY)
+
+        async def run(payload: dict, lease: str | None) -> Any:
+            try:
+                async with slots:
+                    return await ASYNC_SEARCHES[task](payload)
+            finally:
+                await asyncio.to_thread(backpressure.release_lease, payload['mobili_url'], lease)
+
+        return await asyncio.gather(
+            *(run(payload, lease) for payload, lease in zip(payloads, leases)),
+            return_exceptions=True
+        )
+
+    results = pool.run(run_all())
+    failed = [result for result in results if isinstance(result, Exception)]
+    for error in failed:
+        logging.warning(f"Search failed in batch: {str(error)}")
+
+    # One compact summary instead of every search's result
+    return {
+        "searches": len(payloads),
+        "failed": len(failed),
+        "seconds": round(time.monotonic() - start, 1),
+    }
+
+
+@celery_app.task
+def session_stats() -> dict:
+    return pool.stats()
+
+
+@celery_app.task
+def dispatch_stats() -> dict:
+    # Cycles deferred or skipped for backlog and searches skipped for a held lease
+    return backpressure.stats()
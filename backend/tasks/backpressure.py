@@ -0,0 +1,80 @@
+import uuid
+import logging
+
+from app.core.config import settings
+
+from .state import get_redis, search_key
+from .sharding import known_queues
+
+
+STATS_KEY = "scrape:dispatch:stats"
+# Celery's default queue, a Redis list on the broker
+QUEUES = ("celery",)
+
+# Delete the lease only if it's still ours
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_lease(search_url: str) -> str | None:
+    """Lease a search for one run, None while a previous run still holds it.
+
+    Leases expire after SCRAPE_LEASE_TTL so a crashed worker can't block a search for good."""
+
+    token = uuid.uuid4().hex
+    try:
+        if get_redis().set(search_key("scrape:lease", search_url), token, nx=True, ex=settings.SCRAPE_LEASE_TTL):
+            return token
+        return None
+    except Exception as e:
+        logging.warning(f"Lease unavailable, dispatching anyway: {str(e)}")
+        return token
+
+
+def release_lease(search_url: str, token: str | None) -> None:
+    if not token:
+        return
+    try:
+        r = get_redis()
+        r.eval(RELEASE_SCRIPT, 1, search_key("scrape:lease", search_url), token)
+    except Exception as e:
+        logging.warning(f"Failed to release lease for {search_url}: {str(e)}")
+
+
+def queue_depth() -> int:
+    """Messages waiting on the broker across the default and shard queues,
+    including shards that left the ring but weren't drained yet."""
+
+    r = get_redis()
+    return sum(r.llen(queue) for queue in (*QUEUES, *known_queues()))
+
+
+def backlogged() -> bool:
+    if not settings.SCRAPE_MAX_BACKLOG:
+        return False
+    try:
+        depth = queue_depth()
+    except Exception as e:
+        logging.warning(f"Failed to read queue depth: {str(e)}")
+        return False
+    if depth > settings.SCRAPE_MAX_BACKLOG:
+        logging.warning(f"Broker backlog at {depth} message(s)")
+        return True
+    return False
+
+
+def count(field: str, amount: int = 1) -> None:
+    try:
+        get_redis().hincrby(STATS_KEY, field, amount)
+    except Exception as e:
+        logging.warning(f"Failed to count {field}: {str(e)}")
+
+
+def stats() -> dict[str, int]:
+    """Skipped and deferred dispatch counters, cumulative since the stats key was created."""
+
+    return {field.decode(): int(value) for field, value in get_redis().hgetall(STATS_KEY).items()}
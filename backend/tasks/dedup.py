@@ -0,0 +1,55 @@
+import time
+import logging
+
+from app.models import Ad
+from app.core.config import settings
+
+from .state import get_redis
+
+
+def unseen_ads(chat_id: int, ads: list[Ad]) -> list[Ad]:
+    """Drop ads this chat was already sent, using a Redis sorted set of listing IDs.
+
+    Only reads the set, `mark_seen` records the ads once the API accepted
+    them. A chat without a set yet gets the full list so the API seeds it
+    silently, as does any Redis failure."""
+
+    if not settings.SCRAPE_DEDUP or not ads:
+        return ads
+
+    key = f"scrape:seen:{chat_id}"
+    try:
+        pipe = get_redis().pipeline()
+        pipe.exists(key)
+        pipe.zmscore(key, [ad.id for ad in ads])
+        exists, scores = pipe.execute()
+    except Exception as e:
+        logging.warning(f"Seen set unavailable for {chat_id}, sending all ads: {str(e)}")
+        return ads
+
+    # First time for this chat, let the API seed it
+    if not exists:
+        return ads
+
+    return [ad for ad, score in zip(ads, scores) if score is None]
+
+
+def mark_seen(chat_id: int, ads: list[Ad]) -> None:
+    """Add a chat's current ads to its seen set.
+
+    Members are scored with the last time they were scraped, so ads still
+    listed never expire and delisted ones are evicted after SCRAPE_DEDUP_TTL."""
+
+    if not settings.SCRAPE_DEDUP or not ads:
+        return
+
+    key = f"scrape:seen:{chat_id}"
+    now = time.time()
+    try:
+        pipe = get_redis().pipeline()
+        pipe.zadd(key, {ad.id: now for ad in ads})
+        pipe.zremrangebyscore(key, "-inf", now - settings.SCRAPE_DEDUP_TTL)
+        pipe.expire(key, settings.SCRAPE_DEDUP_TTL)
+        pipe.execute()
+    except Exception as e:
+        logging.warning(f"Failed to mark ads seen for {chat_id}: {str(e)}")
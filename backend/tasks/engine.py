@@ -0,0 +1,109 @@
+"""Standalone asyncio scrape engine, an alternative to one Celery task per search.
+
+Runs every search on one event loop, at most SCRAPE_ENGINE_CONCURRENCY at a
+time and SCRAPE_HOST_CONCURRENCY pages per host, through the same async search
+and send path the Celery tasks use:
+
+    python -m tasks.engine
+"""
+import json
+import time
+import asyncio
+import logging
+
+from app.core.config import settings
+
+from .sessions import pool
+from .schedule import schedule
+from .app import (
+    ASYNC_SEARCHES,
+    QUEUE_TASKS_URL,
+    group_searches,
+    group_categories,
+    search_group,
+    crawl_category,
+)
+
+
+class ScrapeEngine:
+    def __init__(self, concurrency: int | None = None):
+        self.slots = asyncio.Semaphore(concurrency or settings.SCRAPE_ENGINE_CONCURRENCY)
+        self.in_flight: dict[str, asyncio.Task] = {}
+
+    async def load_searches(self) -> list[tuple[str, dict]]:
+        """(task name, payload) for every current search, read from the streamed dispatch feed."""
+
+        response = await pool.post_async(
+            QUEUE_TASKS_URL, json={"celery_auth": settings.CELERY_AUTH}, stream=True
+        )
+        try:
+            response.raise_for_status()
+            users = [json.loads(line) async for line in response.aiter_lines() if line]
+        finally:
+            await response.aclose()
+
+        if settings.SCRAPE_INDEX:
+            return [(crawl_category.name, category) for category in group_categories(users)]
+        return [(search_group.name, shared) for shared in group_searches(users)]
+
+    def submit(self, task: str, payload: dict) -> bool:
+        # A search still running from an earlier round isn't started again
+        key = payload['mobili_url']
+        if key in self.in_flight:
+            return False
+        self.in_flight[key] = asyncio.create_task(self.run_search(task, payload))
+        return True
+
+    async def run_search(self, task: str, payload: dict) -> None:
+        try:
+            async with self.slots:
+                result = await ASYNC_SEARCHES[task](payload)
+            logging.debug(f"{payload['mobili_url']}: {result}")
+        except Exception as e:
+            logging.warning(f"Search failed for {payload['mobili_url']}: {str(e)}")
+        finally:
+            self.in_flight.pop(payload['mobili_url'], None)
+
+    async def run(self) -> None:
+        logging.info("Scrape engine started")
+        refreshed = 0.0
+        searches: list[tuple[str, dict]] = []
+        while True:
+            if time.monotonic() - refreshed >= settings.SCRAPE_ENGINE_INTERVAL:
+                refreshed = time.monotonic()
+                try:
+                    searches = await self.load_searches()
+                    if settings.SCRAPE_ADAPTIVE:
+                        await asyncio.to_thread(
+                            schedule.sync, {payload['mobili_url']: (task, payload) for task, payload in searches}
+                        )
+                except Exception as e:
+                    logging.warning(f"Failed to load searches: {str(e)}")
+
+                if not settings.SCRAPE_ADAPTIVE:
+                    started = sum(self.submit(task, payload) for task, payload in searches)
+                    logging.info(f"Started {started} of {len(searches)} search(es), {len(self.in_flight)} in flight")
+
+            if settings.SCRAPE_ADAPTIVE:
+                try:
+                    for task, payload in await asyncio.to_thread(schedule.due):
+                        self.submit(task, payload)
+                except Exception as e:
+                    logging.warning(f"Failed to read schedule: {str(e)}")
+                await asyncio.sleep(settings.SCRAPE_POLL_TICK)
+            else:
+                await asyncio.sleep(max(0.0, settings.SCRAPE_ENGINE_INTERVAL - (time.monotonic() - refreshed)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s: %(message)s",
+        level=logging.INFO
+    )
+    try:
+        pool.run(ScrapeEngine().run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info(f"Session pool stats: {pool.stats()}")
+        pool.close()
@@ -0,0 +1,152 @@
+import re
+import json
+import logging
+from bs4 import BeautifulSoup
+
+from app.models import Ad
+from app.core.config import settings
+
+
+# Opening tag of every result card on a results page
+ARTICLE_RE = re.compile(rb"<article\b[^>]*\bclass=[\"'][^\"']*\bclassified\b", re.IGNORECASE)
+NUMBER_RE = re.compile(r"\d[\d.]*")
+# ld+json script blocks, captured without building a DOM
+LD_JSON_RE = re.compile(
+    rb"<script\b[^>]*\btype=[\"']application/ld\+json[\"'][^>]*>(.*?)</script\s*>",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def to_number(value) -> float | None:
+    """Read a number from an ld+json value, a QuantitativeValue or a string like "150.000 km"."""
+
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get('value')
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = NUMBER_RE.search(value)
+        if match:
+            # Thousands are separated with dots on the site
+            return float(match.group().replace('.', ''))
+    return None
+
+
+def to_ad(data: dict) -> Ad | None:
+    """Build an `Ad` from an ld+json listing, None if it isn't one or has no listing ID."""
+
+    try:
+        url = data['url']
+        image = data['image']
+        name = data['name'].strip()
+        production_date = data['productionDate']
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+    ad_id = Ad.id_from_url(url)
+    if ad_id is None:
+        logging.debug(f"No listing ID in {url}")
+        return None
+
+    # Some listings carry several images, keep the first
+    if isinstance(image, list):
+        image = image[0] if image else None
+
+    offers = data.get('offers')
+    price = to_number(offers.get('price')) if isinstance(offers, dict) else None
+
+    engine = data.get('vehicleEngine')
+    if isinstance(engine, list):
+        engine = engine[0] if engine else None
+    if not isinstance(engine, dict):
+        engine = {}
+
+    return Ad(
+        ad_id, name, url, image, str(production_date), price,
+        to_number(data.get('mileageFromOdometer')),
+        to_number(engine.get('engineDisplacement')),
+        to_number(engine.get('enginePower')),
+    )
+
+
+def extract_fast(content: bytes) -> tuple[list[Ad], int]:
+    """Extract ads and the article count by scanning the raw page bytes.
+
+    Every ld+json block is decoded and anything shaped like an ad is kept,
+    deduplicated by URL in page order, instead of relying on the position of
+    the blocks on the page."""
+
+    article_count = len(ARTICLE_RE.findall(content))
+    if not article_count:
+        return [], 0
+
+    ads: list[Ad] = []
+    seen: set[int] = set()
+    for match in LD_JSON_RE.finditer(content):
+        try:
+            objects = json.loads(match.group(1))
+        except ValueError:
+            logging.warning("Failed to decode result JSON")
+            continue
+        if isinstance(objects, dict):
+            objects = [objects]
+        if not isinstance(objects, list):
+            continue
+        for data in objects:
+            ad = to_ad(data)
+            if ad is None or ad.id in seen:
+                continue
+            seen.add(ad.id)
+            ads.append(ad)
+
+    return ads, article_count
+
+
+def extract_bs4(content: bytes) -> tuple[list[Ad], int]:
+    """Original BeautifulSoup extraction, kept as a fallback."""
+
+    ads: list[Ad] = []
+
+    # Parse response and search for results
+    soup = BeautifulSoup(content, "html.parser")
+    articles = soup.select("article.classified")
+
+    if not articles:
+        return ads, 0
+
+    scripts = soup.find_all("script", {"type": "application/ld+json"})
+    scripts = scripts[::2]
+    for script in scripts:
+        try:
+            objects = json.loads(script.string)
+            for data in objects:
+                ad = to_ad(data)
+                if ad is not None:
+                    ads.append(ad)
+        except IndexError:
+            logging.warning("Failed to index result JSON")
+            continue
+
+    return ads, len(articles)
+
+
+def parse_page(content: bytes) -> tuple[list[Ad], int]:
+    """Parse a results page into its ads and the number of `article.classified` on it."""
+
+    if settings.SCRAPE_PARSER == "bs4":
+        return extract_bs4(content)
+
+    try:
+        ads, article_count = extract_fast(content)
+    except Exception as e:
+        logging.warning(f"Fast extractor failed, falling back to BeautifulSoup: {str(e)}")
+        return extract_bs4(content)
+
+    # Results are listed but none could be pulled out, page markup may have changed
+    if article_count and not ads:
+        logging.warning("Fast extractor found no ads, falling back to BeautifulSoup")
+        return extract_bs4(content)
+
+    return ads, article_count
@@ -0,0 +1,69 @@
+import hashlib
+import logging
+
+from app.models import Ad
+from app.core.config import settings
+
+from .state import get_redis, search_key
+
+
+STATS_KEY = "scrape:fingerprint:stats"
+
+
+def count(field: str) -> None:
+    try:
+        get_redis().hincrby(STATS_KEY, field, 1)
+    except Exception as e:
+        logging.warning(f"Failed to count fingerprint {field}: {str(e)}")
+
+
+def pop_stats() -> dict[str, int]:
+    """Return and reset the hit/miss counters, called once per cycle."""
+
+    pipe = get_redis().pipeline()
+    pipe.hgetall(STATS_KEY)
+    pipe.delete(STATS_KEY)
+    stats, _ = pipe.execute()
+    return {field.decode(): int(value) for field, value in stats.items()}
+
+
+def ads_fingerprint(ads: list[Ad], chat_ids: list[int]) -> str:
+    # Subscribers are part of the fingerprint so a newly joined chat still gets seeded
+    digest = hashlib.sha1(",".join(map(str, sorted(chat_ids))).encode())
+    for ad in ads:
+        digest.update(f"\n{ad.id}|{ad.name}|{ad.production_date}|{ad.price}".encode())
+    return digest.hexdigest()
+
+
+def search_unchanged(search_url: str, chat_ids: list[int], ads: list[Ad]) -> bool:
+    """Whether the search fingerprint matches the one stored after the last delivered post."""
+
+    if not settings.SCRAPE_FINGERPRINT:
+        return False
+
+    fingerprint = ads_fingerprint(ads, chat_ids)
+    try:
+        previous = get_redis().get(search_key("scrape:fingerprint", search_url))
+    except Exception as e:
+        logging.warning(f"Failed to read search fingerprint: {str(e)}")
+        return False
+
+    unchanged = previous is not None and previous.decode() == fingerprint
+    count("search_hits" if unchanged else "search_misses")
+    return unchanged
+
+
+def store_fingerprint(search_url: str, chat_ids: list[int], ads: list[Ad]) -> None:
+    """Remember the search fingerprint, only once its ads reached the API."""
+
+    if not settings.SCRAPE_FINGERPRINT:
+        return
+
+    try:
+        get_redis().set(
+            search_key("scrape:fingerprint", search_url),
+            ads_fingerprint(ads, chat_ids),
+            ex=settings.SCRAPE_FINGERPRINT_TTL
+        )
+    except Exception as e:
+        logging.warning(f"Failed to store search fingerprint: {str(e)}")
@@ -0,0 +1,59 @@
+import json
+import logging
+
+from app.models import Ad
+from app.core.config import settings
+
+from .state import get_redis, search_key
+
+
+class Snapshot:
+    """Ads from the last scan of a search, used to stop paginating early.
+
+    Results are sorted by `renewDate_desc`, so once a whole page consists of
+    ads we already saw, the pages after it are assumed unchanged and are
+    filled in from the snapshot instead of being fetched."""
+
+    def __init__(self, search_url: str, ads: list[Ad]):
+        self.search_url = search_url
+        self.ads = ads
+        self.ids = {ad.id for ad in ads}
+
+    @classmethod
+    def load(cls, search_url: str) -> "Snapshot | None":
+        """Load the snapshot for a search, or None when a full rescan is due."""
+
+        r = get_redis()
+        key = search_key("scrape:snapshot", search_url)
+        try:
+            cycle = r.incr(f"{key}:cycle")
+            r.expire(f"{key}:cycle", settings.SCRAPE_SNAPSHOT_TTL)
+            # Periodic full rescan to catch ads that moved or disappeared
+            if cycle % settings.SCRAPE_FULL_RESCAN_EVERY == 0:
+                logging.debug(f"Full rescan due for {search_url}")
+                return None
+            raw = r.get(key)
+        except Exception as e:
+            logging.warning(f"Failed to load search snapshot: {str(e)}")
+            return None
+
+        if not raw:
+            return None
+        return cls(search_url, [Ad(*row) for row in json.loads(raw)])
+
+    @staticmethod
+    def save(search_url: str, ads: list[Ad]) -> None:
+        key = search_key("scrape:snapshot", search_url)
+        try:
+            get_redis().set(key, json.dumps(ads), ex=settings.SCRAPE_SNAPSHOT_TTL)
+        except Exception as e:
+            logging.warning(f"Failed to save search snapshot: {str(e)}")
+
+    def covers(self, page_ads: list[Ad]) -> bool:
+        # A page made up entirely of already seen ads
+        return bool(page_ads) and all(ad.id in self.ids for ad in page_ads)
+
+    def merge(self, fresh_ads: list[Ad]) -> list[Ad]:
+        # Freshly scanned pages first, then the unscanned tail from the last cycle
+        fresh_ids = {ad.id for ad in fresh_ads}
+        return fresh_ads + [ad for ad in self.ads if ad.id not in fresh_ids]
@@ -0,0 +1,116 @@
+import math
+from urllib.parse import urlencode, urlparse, parse_qs, urlunparse
+
+import numpy as np
+
+from app.models import Ad
+
+
+# Range filters evaluated locally, column name -> (from, to) query parameters
+RANGE_FILTERS = {
+    'price': ('price_from', 'price_to'),
+    'year': ('year_from', 'year_to'),
+    'mileage': ('mileage_from', 'mileage_to'),
+    'engine_volume': ('engine_volume_from', 'engine_volume_to'),
+    'power': ('power_from', 'power_to'),
+}
+COLUMNS = tuple(RANGE_FILTERS)
+PRICE = COLUMNS.index('price')
+
+
+def category_url(search_url: str) -> str:
+    """The broad crawl for a search: the same query without its range filters.
+
+    Brand, model, region and every other filter stay in the crawl URL, so
+    searches that only differ in their price/year/mileage/engine/power ranges
+    share one crawl. Listings without a price are always crawled and filtered
+    locally."""
+
+    parsed_url = urlparse(search_url)
+    query_params = parse_qs(parsed_url.query)
+    for low, high in RANGE_FILTERS.values():
+        query_params.pop(low, None)
+        query_params.pop(high, None)
+    query_params['without_price'] = ['1']
+    query = urlencode(
+        sorted((key, sorted(values)) for key, values in query_params.items()),
+        doseq=True
+    )
+    return urlunparse(parsed_url._replace(query=query))
+
+
+def _bound(query_params: dict, key: str, default: float) -> float:
+    try:
+        return float(query_params[key][0])
+    except (KeyError, IndexError, ValueError):
+        return default
+
+
+class ListingTable:
+    """Columnar view of a crawl, one float64 column per range filter, NaN where unknown."""
+
+    def __init__(self, ads: list[Ad]):
+        self.ads = ads
+        self.values = np.full((len(ads), len(COLUMNS)), np.nan)
+        for row, ad in enumerate(ads):
+            self.values[row] = (
+                ad.price,
+                self._year(ad.production_date),
+                ad.mileage,
+                ad.engine_volume,
+                ad.power,
+            )
+
+    @staticmethod
+    def _year(production_date: str | None) -> float:
+        try:
+            return float(str(production_date)[:4])
+        except ValueError:
+            return math.nan
+
+    def __len__(self) -> int:
+        return len(self.ads)
+
+
+class Predicates:
+    """Range predicates compiled from many users' search URLs, evaluated in one pass."""
+
+    def __init__(self, search_urls: list[str]):
+        self.lows = np.full((len(search_urls), len(COLUMNS)), -np.inf)
+        self.highs = np.full((len(search_urls), len(COLUMNS)), np.inf)
+        self.without_price = np.zeros(len(search_urls), dtype=bool)
+        for row, search_url in enumerate(search_urls):
+            query_params = parse_qs(urlparse(search_url).query)
+            for column, (low, high) in enumerate(RANGE_FILTERS.values()):
+                self.lows[row, column] = _bound(query_params, low, -np.inf)
+                self.highs[row, column] = _bound(query_params, high, np.inf)
+            self.without_price[row] = query_params.get('without_price', [''])[0] == '1'
+
+    def match(self, table: ListingTable) -> np.ndarray:
+        """Boolean matrix of users x listings."""
+
+        values = table.values[np.newaxis, :, :]
+        lows = self.lows[:, np.newaxis, :]
+        highs = self.highs[:, np.newaxis, :]
+
+        # NaN compares False, so unknown values only pass unconstrained columns
+        matches = (values >= lows) & (values <= highs)
+        matches |= np.isneginf(lows) & np.isposinf(highs)
+
+        # Listings without a price pass only when the user asked for them, price range or not
+        no_price = np.isnan(table.values[:, PRICE])
+        matches[:, :, PRICE] = np.where(
+            no_price[np.newaxis, :], self.without_price[:, np.newaxis], matches[:, :, PRICE]
+        )
+
+        return matches.all(axis=2)
+
+
+def match_users(ads: list[Ad], search_urls: list[str]) -> list[list[Ad]]:
+    """Ads from a category crawl matching each search, in crawl order."""
+
+    if not ads or not search_urls:
+        return [[] for _ in search_urls]
+    table = ListingTable(ads)
+    matches = Predicates(search_urls).match(table)
+    return [[ads[i] for i in np.flatnonzero(row)] for row in matches]
@@ -0,0 +1,217 @@
+import time
+import random
+import asyncio
+import logging
+from contextlib import nullcontext
+from urllib.parse import urlparse
+
+from curl_cffi import requests
+
+from app.core.config import settings
+
+from .sessions import pool
+from .state import get_redis
+
+
+# Responses worth retrying, 403 (the site's block page), 429 and 503 also slow
+# the shared rate down. Any other error status fails the fetch without retries.
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {403, 429, 503}
+
+# Token bucket shared by every worker, refilled at the host's current rate
+ACQUIRE_SCRIPT = """
+local rate = tonumber(redis.call('GET', KEYS[2]) or ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return tostring(wait)
+"""
+
+# Multiply then add to the host's rate, clamped to the configured bounds
+ADAPT_SCRIPT = """
+local rate = tonumber(redis.call('GET', KEYS[1]) or ARGV[5])
+rate = rate * tonumber(ARGV[1]) + tonumber(ARGV[2])
+rate = math.max(tonumber(ARGV[3]), math.min(tonumber(ARGV[4]), rate))
+redis.call('SET', KEYS[1], tostring(rate), 'EX', ARGV[6])
+return tostring(rate)
+"""
+
+# Seconds Redis keeps an idle host's bucket and learned rate
+STATE_TTL = 60 * 60
+
+
+class RetryableStatus(Exception):
+    def __init__(self, response: requests.Response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class HostLimiter:
+    """Redis-backed token bucket per host with an adaptive rate.
+
+    Throttling responses halve the shared rate, fast successful responses
+    raise it additively and slow ones trim it, so all workers converge on
+    the highest rate the site tolerates."""
+
+    def __init__(self):
+        self._acquire = None
+        self._adapt = None
+
+    def _scripts(self):
+        if self._acquire is None:
+            r = get_redis()
+            self._acquire = r.register_script(ACQUIRE_SCRIPT)
+            self._adapt = r.register_script(ADAPT_SCRIPT)
+        return self._acquire, self._adapt
+
+    @staticmethod
+    def _keys(host: str) -> tuple[str, str]:
+        return f"scrape:bucket:{host}", f"scrape:rate:{host}"
+
+    def reserve(self, host: str) -> float:
+        """Take a token for the host, returning how long to wait before retrying if none was free."""
+
+        acquire, _ = self._scripts()
+        try:
+            return float(acquire(
+                keys=self._keys(host),
+                args=[settings.SCRAPE_RATE, settings.SCRAPE_BURST, STATE_TTL]
+            ))
+        except Exception as e:
+            logging.warning(f"Rate limiter unavailable, not limiting: {str(e)}")
+            return 0.0
+
+    def acquire(self, host: str) -> None:
+        while (wait := self.reserve(host)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, host: str) -> None:
+        # The Redis round trip runs off the event loop
+        while (wait := await asyncio.to_thread(self.reserve, host)) > 0:
+            await asyncio.sleep(wait)
+
+    def record(self, host: str, status: int | None, latency: float) -> None:
+        """Adapt the host's rate from a response status (None for a transport error) and latency."""
+
+        if status in THROTTLE_STATUSES:
+            factor, step = 0.5, 0.0
+        elif status is None or status >= 400 or latency > settings.SCRAPE_SLOW_RESPONSE:
+            factor, step = 0.9, 0.0
+        else:
+            factor, step = 1.0, settings.SCRAPE_RATE_STEP
+
+        _, adapt = self._scripts()
+        try:
+            rate = adapt(
+                keys=[self._keys(host)[1]],
+                args=[
+                    factor, step,
+                    settings.SCRAPE_RATE_MIN, settings.SCRAPE_RATE_MAX,
+                    settings.SCRAPE_RATE, STATE_TTL
+                ]
+            )
+            if factor < 1:
+                logging.info(f"Slowing down {host} to {float(rate):.2f} req/s after {status or 'error'}")
+        except Exception as e:
+            logging.warning(f"Failed to adapt rate for {host}: {str(e)}")
+
+
+limiter = HostLimiter()
+
+# Pages in flight per host on the async path
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def host_slot(host: str) -> asyncio.Semaphore | nullcontext:
+    if not settings.SCRAPE_HOST_CONCURRENCY:
+        return nullcontext()
+    return _host_slots.setdefault(host, asyncio.Semaphore(settings.SCRAPE_HOST_CONCURRENCY))
+
+
+def backoff(attempt: int, response: requests.Response | None = None) -> float:
+    # Respect Retry-After when the site sends one, otherwise full jitter
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.SCRAPE_BACKOFF_CAP)
+    ceiling = min(settings.SCRAPE_BACKOFF_CAP, settings.SCRAPE_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def fetch(url: str, **kwargs) -> requests.Response:
+    """GET through the shared session pool, rate limited and retried on throttling or transient errors.
+
+    Raises once retries run out or on any other error status."""
+
+    host = urlparse(url).netloc.lower()
+    attempt = 0
+    while True:
+        if settings.SCRAPE_RATE_LIMIT:
+            limiter.acquire(host)
+        start = time.monotonic()
+        response = None
+        try:
+            response = pool.get(url, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableStatus(response)
+        except Exception as e:
+            if settings.SCRAPE_RATE_LIMIT:
+                limiter.record(host, response.status_code if response is not None else None, time.monotonic() - start)
+            if attempt >= settings.SCRAPE_RETRIES:
+                raise
+            delay = backoff(attempt, response)
+            logging.warning(f"Retrying {url} in {delay:.1f}s after {str(e)}")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if settings.SCRAPE_RATE_LIMIT:
+            limiter.record(host, response.status_code, time.monotonic() - start)
+        # An error page must not pass for an empty results page
+        response.raise_for_status()
+        return response
+
+
+async def fetch_async(url: str, **kwargs) -> requests.Response:
+    """Async variant of `fetch`."""
+
+    host = urlparse(url).netloc.lower()
+    attempt = 0
+    while True:
+        if settings.SCRAPE_RATE_LIMIT:
+            await limiter.acquire_async(host)
+        start = time.monotonic()
+        response = None
+        try:
+            async with host_slot(host):
+                response = await pool.get_async(url, **kwargs)
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableStatus(response)
+        except Exception as e:
+            if settings.SCRAPE_RATE_LIMIT:
+                await asyncio.to_thread(limiter.record, host, response.status_code if response is not None else None, time.monotonic() - start)
+            if attempt >= settings.SCRAPE_RETRIES:
+                raise
+            delay = backoff(attempt, response)
+            logging.warning(f"Retrying {url} in {delay:.1f}s after {str(e)}")
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        if settings.SCRAPE_RATE_LIMIT:
+            await asyncio.to_thread(limiter.record, host, response.status_code, time.monotonic() - start)
+        # An error page must not pass for an empty results page
+        response.raise_for_status()
+        return response
@@ -0,0 +1,109 @@
+import json
+import time
+import hashlib
+import logging
+
+from app.models import Ad
+from app.core.config import settings
+
+from .state import get_redis
+
+
+# Search key -> next run time
+SCHEDULE_KEY = "scrape:schedule"
+# Search key -> task name and payload to dispatch
+SEARCHES_KEY = "scrape:schedule:searches"
+# Search key -> current polling interval in seconds
+INTERVALS_KEY = "scrape:schedule:intervals"
+# Search key -> digest of the ad IDs seen on the last poll
+DIGESTS_KEY = "scrape:schedule:digests"
+
+# Pop due searches and push each one out by its interval until its poll reports back
+DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, key in ipairs(due) do
+    local interval = tonumber(redis.call('HGET', KEYS[2], key) or ARGV[3])
+    redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + interval, key)
+end
+return due
+"""
+
+
+class PollSchedule:
+    """Next-run times per search in a Redis sorted set.
+
+    A search whose ads changed on its last poll goes back to SCRAPE_POLL_MIN,
+    a quiet one backs off by SCRAPE_POLL_BACKOFF up to SCRAPE_POLL_MAX."""
+
+    def __init__(self):
+        self._due = None
+
+    def sync(self, searches: dict[str, tuple[str, dict]]) -> None:
+        """Register the current searches (key -> task name, payload) and drop the ones no longer wanted."""
+
+        r = get_redis()
+        stale = {key.decode() for key in r.zrange(SCHEDULE_KEY, 0, -1)} - set(searches)
+
+        pipe = r.pipeline()
+        if searches:
+            pipe.hset(SEARCHES_KEY, mapping={
+                key: json.dumps({'task': task, 'payload': payload})
+                for key, (task, payload) in searches.items()
+            })
+            # New searches are due straight away
+            pipe.zadd(SCHEDULE_KEY, {key: time.time() for key in searches}, nx=True)
+        if stale:
+            pipe.zrem(SCHEDULE_KEY, *stale)
+            for key in (SEARCHES_KEY, INTERVALS_KEY, DIGESTS_KEY):
+                pipe.hdel(key, *stale)
+        pipe.execute()
+
+    def due(self, limit: int = 1000) -> list[tuple[str, dict]]:
+        """Task name and payload of every search due now."""
+
+        r = get_redis()
+        if self._due is None:
+            self._due = r.register_script(DUE_SCRIPT)
+        keys = self._due(
+            keys=[SCHEDULE_KEY, INTERVALS_KEY],
+            args=[time.time(), limit, settings.SCRAPE_POLL_MIN]
+        )
+        if not keys:
+            return []
+        searches = r.hmget(SEARCHES_KEY, keys)
+        return [
+            (search['task'], search['payload'])
+            for search in (json.loads(value) for value in searches if value)
+        ]
+
+    def record(self, key: str, ads: list[Ad]) -> None:
+        """Reschedule a search after a poll, sooner if its ads changed."""
+
+        digest = hashlib.sha1(",".join(sorted(str(ad.id) for ad in ads)).encode()).hexdigest()
+        r = get_redis()
+        try:
+            previous, interval = r.hget(DIGESTS_KEY, key), r.hget(INTERVALS_KEY, key)
+            if previous is None or previous.decode() != digest:
+                interval = settings.SCRAPE_POLL_MIN
+            else:
+                interval = min(
+                    settings.SCRAPE_POLL_MAX,
+                    float(interval or settings.SCRAPE_POLL_MIN) * settings.SCRAPE_POLL_BACKOFF
+                )
+
+            pipe = r.pipeline()
+            pipe.hset(DIGESTS_KEY, key, digest)
+            pipe.hset(INTERVALS_KEY, key, interval)
+            # XX so a search dropped meanwhile isn't brought back
+            pipe.zadd(SCHEDULE_KEY, {key: time.time() + interval}, xx=True)
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f"Failed to reschedule {key}: {str(e)}")
+
+
+schedule = PollSchedule()
+
+
+def record_poll(key: str, ads: list[Ad]) -> None:
+    if settings.SCRAPE_ADAPTIVE:
+        schedule.record(key, ads)
@@ -1,128 +1,535 @@
+import re
+import gzip
 import json
+import math
+import asyncio
 import logging
+import msgpack
 from rich import print
 from typing import Any
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from curl_cffi import requests
-from curl_cffi.requests import exceptions
+from curl_cffi.requests import Response, exceptions
 from urllib.parse import urlencode, urlparse, parse_qs, urlunparse
 
 
+from app.models import Ad
 from app.core.config import settings
 
+from .sessions import pool
+from .limiter import fetch, fetch_async
+from .extract import parse_page
+from .fingerprint import search_unchanged, store_fingerprint
+from .incremental import Snapshot
+from .index import match_users
+from .dedup import unseen_ads, mark_seen
+from .schedule import record_poll
 
 
-def search_main(user: dict) -> Any:
-    search_url = user['mobili_url']
-    chat_id = user['chat_id']
+SEND_ADS_URL = "https://auto-nabavka.onrender.com/api/send-ads"
+# SEND_ADS_URL = "http://localhost:8000/api/send-ads"
+SEND_ADS_BATCH_URL = "https://auto-nabavka.onrender.com/api/send-ads-batch"
 
-    # Ads to be jsonified and returned by function
-    ads: list[dict] = []
-
-    # Request headers
-    headers = {
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-        'Accept-Encoding': 'gzip, deflate, br, zstd',
-        'Accept-Language': 'en-GB,en;q=0.9,en-US;q=0.8',
-        'Cache-Control': 'no-cache',
-        'Pragma': 'no-cache',
-        'Priority': 'u=0, i',
-        'Sec-Ch-Ua': '"Chromium";v="128", "Not;A=Brand";v="24", "DuckDuckGo";v="128"',
-        'Sec-Ch-Ua-Mobile': '?0',
-        'Sec-Ch-Ua-Platform': '"Windows"',
-        'sec-fetch-mode': 'navigate',
-        'sec-fetch-dest': 'document',
-        'sec-fetch-site': 'same-origin',
-        'sec-gpc': '1',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'
+# Request headers
+HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Accept-Encoding': 'gzip, deflate, br, zstd',
+    'Accept-Language': 'en-GB,en;q=0.9,en-US;q=0.8',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache',
+    'Priority': 'u=0, i',
+    'Sec-Ch-Ua': '"Chromium";v="128", "Not;A=Brand";v="24", "DuckDuckGo";v="128"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-site': 'same-origin',
+    'sec-gpc': '1',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36 Edg/128.0.0.0'
+}
+
+# "Prikazano od 1 do 25 oglasa od ukupno 1.234" on the results page
+TOTAL_COUNT_RE = re.compile(rb"od\s+ukupno\s+([\d.,]+)", re.IGNORECASE)
+
+
+def build_page_url(search_url: str, page: int) -> str:
+    # Parse the existing URL
+    parsed_url = urlparse(search_url)
+
+    # Extract existing query parameters
+    query_params = parse_qs(parsed_url.query)
+
+    if page > 1:
+        # Remove 'tag' parameter if page is greater than 1
+        query_params.pop('tag', None)
+
+        # Add city_distance=0 if page is greater than 1
+        query_params['city_distance'] = ['0']
+
+    # Add or update the 'page' parameter
+    query_params['page'] = [str(page)]  # Ensure page is a string
+
+    # Rebuild the URL with the updated query parameters
+    return urlunparse(
+        parsed_url._replace(query=urlencode(query_params, doseq=True))
+    )
+
+
+def parse_total_count(content: bytes) -> int | None:
+    """Read the total number of results advertised on the first page, if present."""
+
+    match = TOTAL_COUNT_RE.search(content)
+    if not match:
+        return None
+    digits = re.sub(rb"\D", b"", match.group(1))
+    return int(digits) if digits else None
+
+
+# (chat_id, ads not sent to the chat yet, every current ad)
+Pending = tuple[int, list[Ad], list[Ad]]
+
+
+def chat_payload(chat_id: int, new_ads: list[Ad], ads: list[Ad]) -> dict:
+    payload = {'chat_id': chat_id, 'ads': new_ads}
+    # The API prunes seen ads that are no longer listed, so it still needs every current ID
+    if len(new_ads) < len(ads):
+        payload['ad_ids'] = [ad.id for ad in ads]
+    return payload
+
+
+def ads_payload(chat_id: int, new_ads: list[Ad], ads: list[Ad]) -> dict:
+    return {
+        'celery_auth': settings.CELERY_AUTH,
+        **chat_payload(chat_id, new_ads, ads)
     }
 
+
+def batch_body(pending: list[Pending]) -> tuple[bytes, dict]:
+    """Encoded /send-ads-batch body and its headers, per SCRAPE_SEND_FORMAT and SCRAPE_SEND_GZIP."""
+
+    payload = {
+        'celery_auth': settings.CELERY_AUTH,
+        'results': [chat_payload(*entry) for entry in pending]
+    }
+    if settings.SCRAPE_SEND_FORMAT == "msgpack":
+        body = msgpack.packb(payload)
+        headers = {'Content-Type': 'application/msgpack'}
+    else:
+        body = json.dumps(payload).encode()
+        headers = {'Content-Type': 'application/json'}
+    if settings.SCRAPE_SEND_GZIP:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+class ScrapeError(Exception):
+    pass
+
+
+class PostError(str):
+    """Result of a post that didn't reach the API, so the search isn't stored as unchanged."""
+
+
+def canonical_search_url(search_url: str) -> str:
+    """Normalize a search URL so equivalent searches compare equal.
+
+    Applies the same query rewriting as `build_page_url`: blank parameters are
+    dropped by `parse_qs`, the `page` parameter is removed, and the remaining
+    parameters and their values are sorted."""
+
+    parsed_url = urlparse(search_url.strip())
+    query_params = parse_qs(parsed_url.query)
+    query_params.pop('page', None)
+    query = urlencode(
+        sorted((key, sorted(values)) for key, values in query_params.items()),
+        doseq=True
+    )
+    return urlunparse(parsed_url._replace(
+        scheme=parsed_url.scheme.lower(),
+        netloc=parsed_url.netloc.lower(),
+        query=query,
+        fragment=''
+    ))
+
+
+def load_snapshot(search_url: str) -> Snapshot | None:
+    if not settings.SCRAPE_INCREMENTAL:
+        return None
+    return Snapshot.load(canonical_search_url(search_url))
+
+
+def save_snapshot(search_url: str, ads: list[Ad]) -> None:
+    if settings.SCRAPE_INCREMENTAL:
+        Snapshot.save(canonical_search_url(search_url), ads)
+
+
+def fetch_ads(search_url: str) -> list[Ad]:
+    # Ads to be jsonified and returned by function
+    ads: list[Ad] = []
+    snapshot = load_snapshot(search_url)
+
     page = 1
     while True:
-        # Parse the existing URL
-        parsed_url = urlparse(search_url)
-
-        # Extract existing query parameters
-        query_params = parse_qs(parsed_url.query)
-
-        if page > 1:
-            # Remove 'tag' parameter if page is greater than 1
-            query_params.pop('tag', None)
-
-            # Add city_distance=0 if page is greater than 1
-            query_params['city_distance'] = ['0']
-        
-        # Add or update the 'page' parameter
-        query_params['page'] = [str(page)]  # Ensure page is a string
-        
-        # Rebuild the URL with the updated query parameters
-        paginated_url = urlunparse(
-            parsed_url._replace(query=urlencode(query_params, doseq=True))
-        )
+        paginated_url = build_page_url(search_url, page)
 
         logging.debug(f"Searching page {page} with filters")
         try:
-            response = requests.get(impersonate="chrome", url=paginated_url, headers=headers)
+            response = fetch(paginated_url, headers=HEADERS)
         except Exception as e:
-            return f"Failed to fetch results page {page}: {str(e)}"
-
-        # Parse response and search for results
-        soup = BeautifulSoup(response.content, "html.parser")
-        articles = soup.select("article.classified")
+            raise ScrapeError(f"Failed to fetch results page {page}: {str(e)}")
 
-        if not articles:
+        page_ads, article_count = parse_page(response.content)
+        if not article_count:
             break
 
-        logging.debug(f"Found {len(articles)} ads for user: {chat_id} on page {page}")
-        scripts = soup.find_all("script", {"type": "application/ld+json"})
-        scripts = scripts[::2]
-        for script in scripts:
-            try:
-                objects = json.loads(script.string)
-                for data in objects:
-                    try:
-                        ad = {
-                            'image': data['image'],
-                            'name': data['name'].strip(),
-                            'url': data['url'],
-                            'production_date': data['productionDate'],
-                        }
-                        ads.append(ad)
-                    except KeyError:
-                        continue
-            except IndexError:
-                logging.warning("Failed to index result JSON")
-                continue
+        logging.debug(f"Found {article_count} ads on page {page}")
+        ads.extend(page_ads)
 
+        # Nothing new past this page since the last cycle
+        if snapshot is not None and snapshot.covers(page_ads):
+            logging.debug(f"Stopping early at page {page}")
+            ads = snapshot.merge(ads)
+            break
         page += 1
 
+    save_snapshot(search_url, ads)
+    return ads
+
+
+def split_unseen(results: list[tuple[int, list[Ad]]]) -> tuple[list[Pending], dict]:
+    """Chats that still have ads to post, and a result for the ones that don't."""
+
+    pending, skipped = [], {}
+    for chat_id, ads in results:
+        # Only ads the chat wasn't sent yet cross the wire
+        new_ads = unseen_ads(chat_id, ads)
+        if new_ads:
+            pending.append((chat_id, new_ads, ads))
+        else:
+            # Keeps ads that are still listed from expiring out of the seen set
+            mark_seen(chat_id, ads)
+            skipped[chat_id] = "No new ads"
+    return pending, skipped
+
+
+def accepted(res: Response) -> bool:
+    return 200 <= res.status_code < 300
+
+
+def chat_result(res: Response, chat_id: int, ads: list[Ad]) -> Any:
+    """Result of a /send-ads response, marking the ads seen only once the API accepted them."""
+
+    if not accepted(res):
+        return PostError(f"HTTP {res.status_code}: {res.text}")
+    mark_seen(chat_id, ads)
+    return res.json()
+
+
+def batch_results(res: Response, pending: list[Pending]) -> dict:
+    """Result per chat of a /send-ads-batch response, see `chat_result`."""
+
+    if not accepted(res):
+        return {chat_id: PostError(f"HTTP {res.status_code}: {res.text}") for chat_id, _, _ in pending}
+    for chat_id, _, ads in pending:
+        mark_seen(chat_id, ads)
+    return res.json().get('results', {})
+
+
+def post_ads(chat_id: int, ads: list[Ad]) -> Any:
+    pending, skipped = split_unseen([(chat_id, ads)])
+    if not pending:
+        return skipped[chat_id]
+
+    # Use API to send ads
+    _, new_ads, ads = pending[0]
+    try:
+        res = pool.post(SEND_ADS_URL, json=ads_payload(chat_id, new_ads, ads))
+    except exceptions.RequestException as e:
+        return PostError(e)
+    return chat_result(res, chat_id, ads)
+
+
+def match_results(category: dict, ads: list[Ad]) -> tuple[dict, list[tuple[int, list[Ad]]]]:
+    """Match a category crawl against its users, returning results for users
+    with nothing to post and the (chat_id, ads) pairs still to post."""
+
+    results, pending = {}, []
+    users = category['users']
+    for user, matched in zip(users, match_users(ads, [user['mobili_url'] for user in users])):
+        if not matched:
+            results[user['chat_id']] = "No ads found"
+        elif search_unchanged(user['mobili_url'], [user['chat_id']], matched):
+            results[user['chat_id']] = "Unchanged"
+        else:
+            pending.append((user['chat_id'], matched))
+    return results, pending
+
+
+def store_delivered(search_url: str, chat_ids: list[int], ads: list[Ad], results: dict) -> None:
+    # A failed post must not read as unchanged on later cycles
+    if not any(isinstance(results.get(chat_id), PostError) for chat_id in chat_ids):
+        store_fingerprint(search_url, chat_ids, ads)
+
+
+def store_matches(category: dict, pending: list[tuple[int, list[Ad]]], results: dict) -> None:
+    urls = {user['chat_id']: user['mobili_url'] for user in category['users']}
+    for chat_id, matched in pending:
+        store_delivered(urls[chat_id], [chat_id], matched, results)
+
+
+def post_ads_batch(results: list[tuple[int, list[Ad]]]) -> dict:
+    """Post many chats' ads in one request, returning a result per chat."""
+
+    pending, posted = split_unseen(results)
+    if pending:
+        body, headers = batch_body(pending)
+        try:
+            res = pool.post(SEND_ADS_BATCH_URL, data=body, headers=headers)
+        except exceptions.RequestException as e:
+            posted.update({chat_id: PostError(e) for chat_id, _, _ in pending})
+        else:
+            posted.update(batch_results(res, pending))
+    return posted
+
+
+def post_results(results: list[tuple[int, list[Ad]]]) -> dict:
+    # One request for every chat, or one per chat
+    if settings.SCRAPE_SEND_BATCH:
+        return post_ads_batch(results)
+    return {chat_id: post_ads(chat_id, ads) for chat_id, ads in results}
+
+
+def search_main(user: dict) -> Any:
+    try:
+        ads = fetch_ads(user['mobili_url'])
+    except ScrapeError as e:
+        return str(e)
+
     # No results found
     if not ads:
         return "No ads found"
 
-    # Transform ads to caption only
-    ads = [
-        f"Name: {ad['name']}\nURL: {ad['url']}\nProduction Date: {ad['production_date']}"
-        for ad in ads
-    ]
-    # Use API to send ads
-    celery_auth = settings.CELERY_AUTH
-    payload = {
-        'celery_auth': celery_auth,
-        'chat_id': chat_id,
-        'ads': ads
-    }
+    # Same ads as the previous cycle, nothing for the API to diff
+    if search_unchanged(user['mobili_url'], [user['chat_id']], ads):
+        return "Unchanged"
+
+    result = post_ads(user['chat_id'], ads)
+    store_delivered(user['mobili_url'], [user['chat_id']], ads, {user['chat_id']: result})
+    return result
+
+
+def search_shared(search: dict) -> Any:
+    """Scrape one canonical search once and fan the ads out to every subscribed chat."""
+
+    try:
+        ads = fetch_ads(search['mobili_url'])
+    except ScrapeError as e:
+        return str(e)
+    record_poll(search['mobili_url'], ads)
+
+    # No results found
+    if not ads:
+        return "No ads found"
+
+    if search_unchanged(search['mobili_url'], search['chat_ids'], ads):
+        return "Unchanged"
+
+    results = post_results([(chat_id, ads) for chat_id in search['chat_ids']])
+    store_delivered(search['mobili_url'], search['chat_ids'], ads, results)
+    return results
+
+
+def post_matches(category: dict, ads: list[Ad]) -> dict:
+    results, pending = match_results(category, ads)
+    results.update(post_results(pending))
+    store_matches(category, pending, results)
+    return results
+
+
+def search_category(category: dict) -> Any:
+    """Crawl a broad category once and match every subscribed user's filters against it."""
+
     try:
-        res = requests.post(
-            url="https://auto-nabavka.onrender.com/api/send-ads",
-            # url="http://localhost:8000/api/send-ads",
-            json=payload
+        ads = fetch_ads(category['mobili_url'])
+    except ScrapeError as e:
+        return str(e)
+    record_poll(category['mobili_url'], ads)
+
+    # No results found
+    if not ads:
+        return "No ads found"
+
+    return post_matches(category, ads)
+
+
+async def fetch_ads_async(search_url: str, concurrency: int | None = None) -> list[Ad]:
+    """Async variant of `fetch_ads`.
+
+    Page 1 is fetched first to learn the total result count, then the remaining
+    pages are fetched concurrently, at most `concurrency` at a time. Ads are
+    collected in page order so the payload matches the sequential scrape."""
+
+    concurrency = concurrency or settings.SCRAPE_CONCURRENCY
+    # Redis calls run off the event loop
+    snapshot = await asyncio.to_thread(load_snapshot, search_url)
+
+    try:
+        response = await fetch_async(build_page_url(search_url, 1), headers=HEADERS)
+    except Exception as e:
+        raise ScrapeError(f"Failed to fetch results page 1: {str(e)}")
+
+    ads, page_size = parse_page(response.content)
+    if not page_size:
+        await asyncio.to_thread(save_snapshot, search_url, ads)
+        return ads
+
+    # Nothing new past page 1 since the last cycle
+    if snapshot is not None and snapshot.covers(ads):
+        ads = snapshot.merge(ads)
+        await asyncio.to_thread(save_snapshot, search_url, ads)
+        return ads
+
+    total = parse_total_count(response.content)
+    if total is None or snapshot is not None:
+        # Result count not advertised or scanning incrementally, walk the pages one by one
+        last_page = None
+    else:
+        last_page = math.ceil(total / page_size)
+    logging.debug(f"Found {total} ads across {last_page} page(s)")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(page: int) -> tuple[list[Ad], int]:
+        async with semaphore:
+            logging.debug(f"Searching page {page} with filters")
+            res = await fetch_async(build_page_url(search_url, page), headers=HEADERS)
+        return parse_page(res.content)
+
+    page = 2
+    exhausted = False
+    if last_page is not None:
+        pages = range(2, last_page + 1)
+        results = await asyncio.gather(
+            *(fetch(page) for page in pages), return_exceptions=True
         )
-        return res.json()
-    except exceptions.HTTPError as e:
+        # Keep page order and stop at the first empty page like the sync scrape
+        for page, result in zip(pages, results):
+            if isinstance(result, Exception):
+                raise ScrapeError(f"Failed to fetch results page {page}: {str(result)}")
+            page_ads, article_count = result
+            if not article_count:
+                exhausted = True
+                break
+            ads.extend(page_ads)
+        # Page 1 is fetched with other parameters than the rest, so its size
+        # can understate the page count, walk on until an empty page
+        page = last_page + 1
+
+    if not exhausted:
+        while True:
+            try:
+                page_ads, article_count = await fetch(page)
+            except Exception as e:
+                raise ScrapeError(f"Failed to fetch results page {page}: {str(e)}")
+            if not article_count:
+                break
+            ads.extend(page_ads)
+            if snapshot is not None and snapshot.covers(page_ads):
+                ads = snapshot.merge(ads)
+                break
+            page += 1
+
+    await asyncio.to_thread(save_snapshot, search_url, ads)
+    return ads
+
+
+async def post_ads_async(chat_id: int, ads: list[Ad]) -> Any:
+    pending, skipped = await asyncio.to_thread(split_unseen, [(chat_id, ads)])
+    if not pending:
+        return skipped[chat_id]
+
+    # Use API to send ads
+    _, new_ads, ads = pending[0]
+    try:
+        res = await pool.post_async(SEND_ADS_URL, json=ads_payload(chat_id, new_ads, ads))
+    except exceptions.RequestException as e:
+        return PostError(e)
+    return await asyncio.to_thread(chat_result, res, chat_id, ads)
+
+
+async def post_ads_batch_async(results: list[tuple[int, list[Ad]]]) -> dict:
+    pending, posted = await asyncio.to_thread(split_unseen, results)
+    if pending:
+        body, headers = await asyncio.to_thread(batch_body, pending)
+        try:
+            res = await pool.post_async(SEND_ADS_BATCH_URL, data=body, headers=headers)
+        except exceptions.RequestException as e:
+            posted.update({chat_id: PostError(e) for chat_id, _, _ in pending})
+        else:
+            posted.update(await asyncio.to_thread(batch_results, res, pending))
+    return posted
+
+
+async def post_results_async(results: list[tuple[int, list[Ad]]]) -> dict:
+    if settings.SCRAPE_SEND_BATCH:
+        return await post_ads_batch_async(results)
+    posted = await asyncio.gather(*(post_ads_async(chat_id, ads) for chat_id, ads in results))
+    return dict(zip([chat_id for chat_id, _ in results], posted))
+
+
+async def search_main_async(user: dict, concurrency: int | None = None) -> Any:
+    try:
+        ads = await fetch_ads_async(user['mobili_url'], concurrency)
+    except ScrapeError as e:
         return str(e)
 
+    # No results found
+    if not ads:
+        return "No ads found"
+
+    if await asyncio.to_thread(search_unchanged, user['mobili_url'], [user['chat_id']], ads):
+        return "Unchanged"
+
+    result = await post_ads_async(user['chat_id'], ads)
+    await asyncio.to_thread(store_delivered, user['mobili_url'], [user['chat_id']], ads, {user['chat_id']: result})
+    return result
+
+
+async def search_shared_async(search: dict, concurrency: int | None = None) -> Any:
+    try:
+        ads = await fetch_ads_async(search['mobili_url'], concurrency)
+    except ScrapeError as e:
+        return str(e)
+    await asyncio.to_thread(record_poll, search['mobili_url'], ads)
+
+    # No results found
+    if not ads:
+        return "No ads found"
+
+    if await asyncio.to_thread(search_unchanged, search['mobili_url'], search['chat_ids'], ads):
+        return "Unchanged"
+
+    results = await post_results_async([(chat_id, ads) for chat_id in search['chat_ids']])
+    await asyncio.to_thread(store_delivered, search['mobili_url'], search['chat_ids'], ads, results)
+    return results
+
+
+async def search_category_async(category: dict, concurrency: int | None = None) -> Any:
+    try:
+        ads = await fetch_ads_async(category['mobili_url'], concurrency)
+    except ScrapeError as e:
+        return str(e)
+    await asyncio.to_thread(record_poll, category['mobili_url'], ads)
+
+    # No results found
+    if not ads:
+        return "No ads found"
+
+    results, pending = await asyncio.to_thread(match_results, category, ads)
+    results.update(await post_results_async(pending))
+    await asyncio.to_thread(store_matches, category, pending, results)
+    return results
+
 
 if __name__ == "__main__":
     # Logging configuration
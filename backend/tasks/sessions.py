@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from urllib.parse import urlparse
+from collections import defaultdict
+
+from curl_cffi import requests, CurlInfo
+from curl_cffi.requests import AsyncSession
+
+from app.core.config import settings
+
+
+class ConnectInfo:
+    """Notes on each response how many connections libcurl opened for it.
+
+    Read while the response is parsed, curl_cffi resets the handle before
+    handing the response back."""
+
+    def _parse_response(self, curl, *args, **kwargs) -> requests.Response:
+        response = super()._parse_response(curl, *args, **kwargs)
+        response.num_connects = curl.getinfo(CurlInfo.NUM_CONNECTS)
+        return response
+
+
+class Session(ConnectInfo, requests.Session):
+    pass
+
+
+class PooledAsyncSession(ConnectInfo, AsyncSession):
+    pass
+
+
+class SessionPool:
+    """Worker-scoped curl_cffi sessions keyed by host.
+
+    Sessions live for the lifetime of the worker process so TLS connections,
+    HTTP/2 multiplexing and site cookies carry over between tasks. Async
+    sessions are bound to the pool's own event loop, so coroutines that use
+    them must be run through `run`."""
+
+    def __init__(self, impersonate: str = "chrome"):
+        self.impersonate = impersonate
+        self._sessions: dict[str, Session] = {}
+        self._async_sessions: dict[str, PooledAsyncSession] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+        # "reused" counts requests sent over a connection libcurl already had open
+        self._counters: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"sessions": 0, "requests": 0, "connects": 0, "reused": 0}
+        )
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def _count(self, url: str, response: requests.Response) -> None:
+        counters = self._counters[self._host(url)]
+        counters["requests"] += 1
+        connects = getattr(response, "num_connects", 0)
+        counters["connects"] += connects
+        if not connects:
+            counters["reused"] += 1
+
+    def session(self, url: str) -> Session:
+        host = self._host(url)
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is not None:
+                return session
+            session = Session(impersonate=self.impersonate)
+            self._sessions[host] = session
+            self._counters[host]["sessions"] += 1
+            logging.debug(f"Opened session for {host}")
+            return session
+
+    def async_session(self, url: str) -> PooledAsyncSession:
+        host = self._host(url)
+        session = self._async_sessions.get(host)
+        if session is not None:
+            return session
+        session = PooledAsyncSession(
+            impersonate=self.impersonate, loop=self.loop, max_clients=settings.SCRAPE_MAX_CLIENTS
+        )
+        self._async_sessions[host] = session
+        self._counters[host]["sessions"] += 1
+        logging.debug(f"Opened async session for {host}")
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        response = self.session(url).request(method, url, **kwargs)
+        self._count(url, response)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    async def request_async(self, method: str, url: str, **kwargs) -> requests.Response:
+        response = await self.async_session(url).request(method, url, **kwargs)
+        self._count(url, response)
+        return response
+
+    async def get_async(self, url: str, **kwargs) -> requests.Response:
+        return await self.request_async("GET", url, **kwargs)
+
+    async def post_async(self, url: str, **kwargs) -> requests.Response:
+        return await self.request_async("POST", url, **kwargs)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+            # asyncio.to_thread runs on this, sized for the Redis calls of many searches at once
+            self._loop.set_default_executor(ThreadPoolExecutor(settings.SCRAPE_REDIS_THREADS))
+        return self._loop
+
+    def run(self, coro) -> Any:
+        """Run a coroutine on the pool's event loop, keeping async sessions alive across tasks."""
+        return self.loop.run_until_complete(coro)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {host: dict(counters) for host, counters in self._counters.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+        if self._loop is not None and not self._loop.is_closed():
+            for session in self._async_sessions.values():
+                self._loop.run_until_complete(session.close())
+            self._loop.close()
+        self._async_sessions.clear()
+        self._loop = None
+
+
+# One pool per worker process
+pool = SessionPool()
@@ -0,0 +1,152 @@
+import time
+import bisect
+import hashlib
+import logging
+import threading
+
+from app.core.config import settings
+
+from .state import get_redis
+
+
+# Shard queue name -> last heartbeat
+MEMBERS_KEY = "scrape:shards"
+# Every shard queue that joined and may still hold messages
+QUEUES_KEY = "scrape:shards:queues"
+# Celery's default queue, consumed by every worker alongside its shard queue
+FALLBACK_QUEUE = "celery"
+
+# Move a queue's messages to the consuming end of another, oldest consumed first
+DRAIN_SCRIPT = """
+local moved = 0
+while redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+
+def queue_name(shard: str) -> str:
+    return f"scrape.{shard}"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring over shard queues.
+
+    Each queue gets SCRAPE_RING_REPLICAS points on the ring, so when a worker
+    joins or leaves only the searches nearest its points move."""
+
+    def __init__(self, queues: list[str], replicas: int | None = None):
+        replicas = replicas or settings.SCRAPE_RING_REPLICAS
+        self.queues = sorted(queues)
+        self._points = sorted(
+            (_hash(f"{queue}#{i}"), queue) for queue in self.queues for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._points]
+
+    def __bool__(self) -> bool:
+        return bool(self._points)
+
+    def queue_for(self, key: str) -> str | None:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._points)
+        return self._points[index][1]
+
+
+def live_queues() -> list[str]:
+    """Shard queues whose worker sent a heartbeat within SCRAPE_SHARD_TTL."""
+
+    r = get_redis()
+    now = time.time()
+    r.zremrangebyscore(MEMBERS_KEY, "-inf", now - settings.SCRAPE_SHARD_TTL)
+    return [queue.decode() for queue in r.zrange(MEMBERS_KEY, 0, -1)]
+
+
+def known_queues() -> list[str]:
+    """Shard queues that may hold messages, live or not."""
+
+    return [queue.decode() for queue in get_redis().smembers(QUEUES_KEY)]
+
+
+def drain_queue(queue: str) -> int:
+    """Hand a shard queue's waiting messages to the default queue so any worker runs them."""
+
+    moved = get_redis().eval(DRAIN_SCRIPT, 2, queue, FALLBACK_QUEUE)
+    if moved:
+        logging.info(f"Re-routed {moved} message(s) from {queue} to {FALLBACK_QUEUE}")
+    return moved
+
+
+def reroute_stranded(live: list[str]) -> None:
+    """Drain the queues of shards that left the ring, their messages would wait there for good."""
+
+    r = get_redis()
+    for queue in set(known_queues()) - set(live):
+        drain_queue(queue)
+        r.srem(QUEUES_KEY, queue)
+
+
+_last_queues: list[str] = []
+
+
+def current_ring() -> HashRing:
+    """Ring over the live shard queues, empty when no worker runs with SCRAPE_SHARD."""
+
+    global _last_queues
+    try:
+        queues = live_queues()
+    except Exception as e:
+        logging.warning(f"Failed to read shard members, not sharding: {str(e)}")
+        queues = []
+    else:
+        try:
+            reroute_stranded(queues)
+        except Exception as e:
+            logging.warning(f"Failed to re-route stranded shard queues: {str(e)}")
+    ring = HashRing(queues)
+    if ring.queues != _last_queues:
+        logging.info(f"Rebalancing searches across shard queues {ring.queues}")
+        _last_queues = ring.queues
+    return ring
+
+
+class Heartbeat:
+    """Keeps this worker's shard queue on the ring while the worker runs."""
+
+    def __init__(self, queue: str):
+        self.queue = queue
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _beat(self) -> None:
+        try:
+            pipe = get_redis().pipeline()
+            pipe.zadd(MEMBERS_KEY, {self.queue: time.time()})
+            pipe.sadd(QUEUES_KEY, self.queue)
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f"Shard heartbeat failed for {self.queue}: {str(e)}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.SCRAPE_SHARD_TTL / 3):
+            self._beat()
+
+    def start(self) -> None:
+        self._beat()
+        self._thread.start()
+
+    def stop(self) -> None:
+        # Leave the ring straight away so searches move on the next dispatch
+        self._stop.set()
+        try:
+            get_redis().zrem(MEMBERS_KEY, self.queue)
+            # Whatever is still waiting here runs elsewhere, anything dispatched
+            # meanwhile is drained by the next dispatch
+            drain_queue(self.queue)
+        except Exception as e:
+            logging.warning(f"Failed to leave shard ring for {self.queue}: {str(e)}")
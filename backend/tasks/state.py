@@ -0,0 +1,17 @@
+import hashlib
+from functools import lru_cache
+
+import redis
+
+from app.core.config import settings
+
+
+@lru_cache
+def get_redis() -> redis.Redis:
+    # Shared client on the broker's Redis, one connection pool per worker process
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+def search_key(prefix: str, search_url: str) -> str:
+    digest = hashlib.sha1(search_url.encode()).hexdigest()
+    return f"{prefix}:{digest}"